@@ -0,0 +1,93 @@
+'''
+Measures how throughput of read-only commands scales with the number of engine threads.
+Many sessions submit read, list, props and search commands at once against one shared tree;
+the same commands run serially through command_parser as the baseline.
+Run from the repository root: python benchmarks/bench_engine.py [number of commands]
+'''
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import filesystem
+
+THREAD_COUNTS = [1, 2, 4, 8]
+SESSION_COUNT = 32
+
+
+def build_tree(folder_count = 200, file_count = 20) -> None:
+    filesystem.set_output_sink(filesystem.SilentSink())
+    filesystem.filesystem = filesystem.Folder('root', '')
+    filesystem.rebuild_name_index(filesystem.filesystem)
+    for i in range(folder_count):
+        filesystem.command_parser(f"folder ~d{i}")
+        filesystem.command_parser(f"in @d{i}")
+        for j in range(file_count):
+            filesystem.command_parser(f"file ~f{j} #{'content of a file ' * 20}")
+        filesystem.command_parser("out")
+
+def read_commands(count, rng):
+    '''
+    Returns (folder, command) pairs, each command to be run from the folder.
+    '''
+    commands = []
+    for i in range(count):
+        folder = f"d{rng.randrange(200)}"
+        roll = rng.random()
+        if roll < 0.4:
+            command = f"read ~f{rng.randrange(20)}"
+        elif roll < 0.7:
+            command = "list"
+        elif roll < 0.9:
+            command = f"props ~f{rng.randrange(20)}"
+        else:
+            command = f"search ~f1{rng.randrange(10)}"
+        commands.append((folder, command))
+    return commands
+
+def run_serial(commands) -> float:
+    root = filesystem.get_root()
+    start = time.perf_counter()
+    for folder, command in commands:
+        filesystem.filesystem = root.get_branch(folder)
+        filesystem.command_parser(command)
+    filesystem.filesystem = root
+    return time.perf_counter() - start
+
+def run_engine(commands, threads) -> float:
+    engine = filesystem.Engine(threads)
+    root = engine.root
+    sessions = [filesystem.Session(root) for i in range(SESSION_COUNT)]
+    # each session runs its commands one after another, as a client would
+    queues = [[] for session in sessions]
+    for i, (folder, command) in enumerate(commands):
+        queues[i % SESSION_COUNT].append((root.get_branch(folder), filesystem.tokenize_command(command)))
+
+    def run_session(session, queue):
+        for folder, args in queue:
+            session.cwd = folder
+            engine.execute(session, args)
+
+    start = time.perf_counter()
+    futures = [engine.pool.submit(run_session, session, queue) for session, queue in zip(sessions, queues)]
+    for future in futures:
+        future.result()
+    elapsed = time.perf_counter() - start
+    engine.pool.shutdown()
+    return elapsed
+
+if __name__ == '__main__':
+    command_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    build_tree()
+    commands = read_commands(command_count, random.Random(0))
+
+    serial = run_serial(commands)
+    print(f"serial command_parser: {command_count / serial:10,.0f} commands/s")
+    base = None
+    for threads in THREAD_COUNTS:
+        elapsed = run_engine(commands, threads)
+        base = base or elapsed
+        print(f"engine, {threads} thread{'s' * (threads != 1)}:  {command_count / elapsed:10,.0f} commands/s  ({base / elapsed:.2f}x)")
+    gil = getattr(sys, '_is_gil_enabled', lambda: True)()
+    print(f"cpus: {os.cpu_count()}, GIL {'enabled' if gil else 'disabled'}")
@@ -0,0 +1,109 @@
+'''
+Measures memory used per node by the filesystem classes against the __dict__ based
+classes they replaced, which are reproduced below as the reference path.
+Run from the repository root: python benchmarks/bench_memory.py [number of nodes]
+'''
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import filesystem
+
+
+# -- REFERENCE PATH: node classes before __slots__, holding the same attributes
+class LegacyNode:
+    def __init__(self, name, context) -> None:
+        self.name = name
+        self.type = 'node'
+        self.context = context
+        self.cached_address = ()
+        self.cached_address_string = ''
+        self.cache_generation = -1
+
+class LegacyFolder(LegacyNode):
+    def __init__(self, name, context) -> None:
+        LegacyNode.__init__(self, name, context)
+        self.branches = []
+        self.branch_index = {}
+        self.type = 'folder'
+        self.clone_source = None
+        self.clone_dependents = []
+
+    def add_branch(self, obj) -> None:
+        self.branches.append(obj)
+        self.branch_index[obj.name] = obj
+
+class LegacyFile(LegacyNode):
+    def __init__(self, name, context, content) -> None:
+        LegacyNode.__init__(self, name, context)
+        self.type = 'file'
+        self.buffer = LegacyContentBuffer(content)
+        self.shared_buffer = False
+
+class LegacyContentBuffer:
+    def __init__(self, text = '') -> None:
+        self.chunks = []
+        self.chunk_ends = []
+        self.byte_size = 0
+        self.char_size = 0
+        self.memory_size = 0
+        if text:
+            data = text.encode('utf-8')
+            self.chunks.append(data)
+            self.byte_size = self.memory_size = len(data)
+            self.chunk_ends.append(self.byte_size)
+            self.char_size = len(text)
+
+class LegacyShortcut(LegacyFolder):
+    def __init__(self, name, context, location) -> None:
+        LegacyFolder.__init__(self, name, context)
+        self.branches = [location]
+        self.type = 'shortcut'
+# -- END REFERENCE PATH
+
+
+def build_tree(folder_class, file_class, shortcut_class, node_count):
+    '''
+    Builds a tree of node_count nodes breadth first. Each folder holds 7 files, a shortcut
+    to the root and 2 folders, and names repeat between folders as they do in real trees.
+    '''
+    root = folder_class('root', '')
+    queue = [root]
+    count = 1
+    while count < node_count:
+        folder = queue.pop(0)
+        for i in range(7):
+            folder.add_branch(file_class(f"file{i}.txt", folder, f"content of file {i}"))
+        folder.add_branch(shortcut_class("link", folder, root))
+        for i in range(2):
+            child = folder_class(f"folder{i}", folder)
+            folder.add_branch(child)
+            queue.append(child)
+        count += 10
+    return root, count
+
+def measure(folder_class, file_class, shortcut_class, node_count):
+    '''
+    Returns the number of nodes built and the bytes allocated to build them.
+    '''
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    root, count = build_tree(folder_class, file_class, shortcut_class, node_count)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del root
+    return count, used
+
+if __name__ == '__main__':
+    node_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+    legacy_count, legacy_bytes = measure(LegacyFolder, LegacyFile, LegacyShortcut, node_count)
+    count, used = measure(filesystem.Folder, filesystem.File, filesystem.Shortcut, node_count)
+
+    print(f"nodes:  {count:,}")
+    print(f"legacy: {legacy_bytes / legacy_count:8.1f} bytes per node ({legacy_bytes / 2**20:.1f} MiB)")
+    print(f"slots:  {used / count:8.1f} bytes per node ({used / 2**20:.1f} MiB)")
+    print(f"saving: {1 - used / legacy_bytes:.1%}")
@@ -0,0 +1,118 @@
+'''
+Measures command parsing throughput of tokenize_command against the regex based
+sanitizer and parser it replaced, which is reproduced below as the reference path.
+Run from the repository root: python benchmarks/bench_parser.py [number of lines]
+'''
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import filesystem
+
+
+# -- REFERENCE PATH: command_sanitizer, extract_arg and command_parser before tokenize_command
+def legacy_sanitizer(command):
+    command_reject = ''
+    if len(command) < 1:
+        return command_reject
+    tag_list = re.findall("[^%][~@#!]", command)
+    if tag_list:
+        tag_list = [tag[1] for tag in tag_list]
+        tag_set = set(())
+        [tag_set.add(tag) for tag in tag_list]
+        if len(tag_list) != len(tag_set):
+            return command_reject
+    command = command.strip()
+    adj_exceptions = re.findall(f".[:@#~!|][:@#~!| ]+", command)
+    for excp in adj_exceptions:
+        if excp[0] != '%':
+            command = re.sub(f"{excp}", f"{excp[1]}", command)
+    adj_exceptions = re.findall(f"[^ %][@#~!]", command)
+    for excp in adj_exceptions:
+        excp_corrected = excp[0] + ' ' + excp[1:]
+        command = re.sub(f"{excp}", f"{excp_corrected}", command)
+    return command
+
+def legacy_extract_arg(tag, command):
+    temp = re.findall(f"[^%]{tag}[^~@!#]+[ ;]", command)
+    if not temp:
+        return []
+    temp = temp[0]
+    l = len(temp) - 1
+    temp = temp[2:l]
+    return temp.split('|')
+
+def legacy_parse(user_command):
+    user_command = legacy_sanitizer(user_command)
+    if user_command == '':
+        return None
+    args = {'name' : [], 'location' : [], 'augment' : '', 'content' : []}
+    command_pair = user_command.split(" ", 1)
+    args['command'] = command_pair.pop(0)
+    if command_pair:
+        user_command = ' ' + command_pair[0] + ';'
+        re.findall("[~@!#]", user_command)
+        args['name'] = legacy_extract_arg('~', user_command)
+        args['location'] = legacy_extract_arg('@', user_command)
+        temp = legacy_extract_arg('!', user_command)
+        args['augment'] = temp[0] if temp else ''
+        args['content'] = legacy_extract_arg('#', user_command)
+    # the function table was rebuilt on every call
+    function_hash = {key : (lambda args: None) for key in filesystem.function_hash}
+    function_hash.get(args['command'])
+    return args
+
+
+def generate_lines(count, seed = 0):
+    '''
+    Returns count command lines in the proportions of a typical save file.
+    '''
+    rng = random.Random(seed)
+    words = ['alpha', 'beta', 'gamma', 'delta', 'log', 'data', 'notes', 'tmp']
+    lines = []
+    for i in range(count):
+        name = f"{rng.choice(words)}{i}"
+        roll = rng.random()
+        if roll < 0.4:
+            lines.append(f"file ~{name} #{' '.join(rng.choices(words, k = 8))}")
+        elif roll < 0.55:
+            lines.append(f"folder ~{name}")
+        elif roll < 0.7:
+            lines.append(f"in @{name}")
+        elif roll < 0.8:
+            lines.append("out")
+        elif roll < 0.9:
+            lines.append(f"write ~{name}|{name}x !append #{rng.choice(words)}|{rng.choice(words)}")
+        else:
+            lines.append(f"cd @root:{name}:{rng.choice(words)}")
+    return lines
+
+def measure(parse, lines) -> float:
+    start = time.perf_counter()
+    for line in lines:
+        parse(line)
+    return time.perf_counter() - start
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    lines = generate_lines(count)
+
+    # both paths must agree on the arguments before their speed is compared
+    for line in lines:
+        new_args = filesystem.tokenize_command(line)
+        old_args = legacy_parse(line)
+        for key in ['command', 'name', 'location', 'augment', 'content']:
+            assert new_args[key] == old_args[key], (line, key, new_args[key], old_args[key])
+
+    old_time = measure(legacy_parse, lines)
+    new_time = measure(filesystem.tokenize_command, lines)
+    print(f"lines: {count}")
+    print(f"regex sanitizer and parser: {count / old_time:,.0f} lines/s")
+    print(f"tokenize_command: {count / new_time:,.0f} lines/s")
+    print(f"speedup: {old_time / new_time:.1f}x")
+
+if __name__ == '__main__':
+    main()
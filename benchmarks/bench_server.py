@@ -0,0 +1,117 @@
+'''
+Load generator for server mode. Opens many concurrent sessions against a filesystem server,
+sends each a mix of read and write commands, and reports throughput and tail latency.
+Starts its own server on a free local port unless --address is passed.
+Run from the repository root: python benchmarks/bench_server.py [--sessions N] [--commands N]
+'''
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def session_commands(session_id, count, rng):
+    '''
+    Returns the commands sent by one session: it builds a folder of its own, then mixes reads
+    of its own and other sessions' folders with writes to its own files.
+    '''
+    home = f"s{session_id}"
+    commands = [f"folder ~{home}", f"in @{home}"]
+    commands.extend([f"file ~f{i} #initial content {i}" for i in range(10)])
+    while len(commands) < count:
+        roll = rng.random()
+        if roll < 0.3:
+            commands.append(f"read ~f{rng.randrange(10)}")
+        elif roll < 0.5:
+            commands.append("list")
+        elif roll < 0.6:
+            commands.append(f"search ~f{rng.randrange(10)}")
+        elif roll < 0.7:
+            commands.append(f"props ~f{rng.randrange(10)}")
+        elif roll < 0.9:
+            commands.append(f"write ~f{rng.randrange(10)} !append #line {len(commands)}")
+        else:
+            commands.append(f"file ~g{len(commands)} #new file")
+    return commands[:count]
+
+async def run_session(address, commands, latencies) -> int:
+    '''
+    Sends commands one at a time, waiting for each done event, and records each round trip.
+    Returns the number of commands that reported errors.
+    '''
+    if address.startswith('unix:'):
+        reader, writer = await asyncio.open_unix_connection(address[5:])
+    else:
+        host, port = address.rsplit(':', 1)
+        reader, writer = await asyncio.open_connection(host, int(port))
+    failed = 0
+    for command in commands:
+        start = time.perf_counter()
+        writer.write(command.encode('utf-8') + b'\n')
+        await writer.drain()
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError("server closed the session")
+            if line.startswith(b'{"event": "done"'):
+                break
+        latencies.append(time.perf_counter() - start)
+        failed += b'"errors": 0}' not in line
+    writer.write(b'exit\n')
+    writer.close()
+    return failed
+
+async def run_load(address, session_count, command_count, seed):
+    rng = random.Random(seed)
+    plans = [session_commands(i, command_count, rng) for i in range(session_count)]
+    latencies = []
+    start = time.perf_counter()
+    failures = await asyncio.gather(*[run_session(address, plan, latencies) for plan in plans])
+    return time.perf_counter() - start, latencies, sum(failures)
+
+def percentile(ordered, fraction) -> float:
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(address):
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'filesystem.py'), '--load', '',
+                               '--output', 'quiet', '--serve', address],
+                              stderr = subprocess.PIPE, text = True)
+    # server reports on stderr once it is listening
+    server.stderr.readline()
+    return server
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description = "Load generator for filesystem server mode.")
+    arg_parser.add_argument('--address', help = "address of a running server, host:port or unix:path")
+    arg_parser.add_argument('--sessions', type = int, default = 50)
+    arg_parser.add_argument('--commands', type = int, default = 400, help = "commands sent by each session")
+    arg_parser.add_argument('--seed', type = int, default = 0)
+    cli_args = arg_parser.parse_args()
+
+    address = cli_args.address or f"127.0.0.1:{free_port()}"
+    server = None if cli_args.address else start_server(address)
+    try:
+        elapsed, latencies, failures = asyncio.run(run_load(address, cli_args.sessions, cli_args.commands, cli_args.seed))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    latencies.sort()
+    print(f"sessions:   {cli_args.sessions}")
+    print(f"commands:   {len(latencies):,} ({failures} with errors)")
+    print(f"throughput: {len(latencies) / elapsed:,.0f} commands/s")
+    for label, fraction in [('p50', 0.50), ('p95', 0.95), ('p99', 0.99), ('p99.9', 0.999)]:
+        print(f"{label + ':':11s} {percentile(latencies, fraction) * 1000:.2f} ms")
+    print(f"max:        {latencies[-1] * 1000:.2f} ms")
@@ -0,0 +1,311 @@
+'''
+Times the core operations of the filesystem against synthetic trees, and writes the results as JSON
+so that runs on different commits can be compared.
+Trees are generated in four shapes: wide (many objects per folder), deep (long chains of folders),
+shortcuts (many shortcuts between folders) and content (few, large files).
+Run from the repository root: python benchmarks/bench_suite.py [--scale N] [--output results.json] [--compare old.json]
+'''
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import filesystem
+
+# operations slower than the compared run by more than this fraction are reported as regressions
+REGRESSION_MARGIN = 0.10
+
+
+# -- TREE GENERATORS
+# each generator builds its tree from the node classes directly, and returns the root,
+# the addresses of some folders deep in the tree, and the name of an object to search for
+def wide_tree(scale, rng):
+    '''
+    100 folders of 500 files each below the root, and one folder of 5,000 files.
+    '''
+    root = filesystem.Folder('root', '')
+    for i in range(100 * scale):
+        folder = filesystem.Folder(f"w{i}", root)
+        root.add_branch(folder)
+        for j in range(500):
+            folder.add_branch(filesystem.File(f"file{j}.txt", folder, f"content {i} {j}"))
+    flat = filesystem.Folder('flat', root)
+    root.add_branch(flat)
+    for j in range(5000 * scale):
+        flat.add_branch(filesystem.File(f"entry{j}", flat, ''))
+    targets = [f"root:w{rng.randrange(100 * scale)}" for i in range(20)] + ['root:flat']
+    return root, targets, 'file499.txt'
+
+def deep_tree(scale, rng):
+    '''
+    20 chains of 400 nested folders below the root, each folder holding 3 files.
+    '''
+    root = filesystem.Folder('root', '')
+    targets = []
+    for i in range(20 * scale):
+        folder = root
+        address = ['root']
+        for depth in range(400):
+            child = filesystem.Folder(f"c{i}d{depth}", folder)
+            folder.add_branch(child)
+            folder = child
+            address.append(folder.name)
+            for j in range(3):
+                folder.add_branch(filesystem.File(f"leaf{j}", folder, f"depth {depth}"))
+        targets.append(':'.join(address))
+    return root, targets, 'c0d399'
+
+def shortcut_tree(scale, rng):
+    '''
+    2,000 folders in two levels, each holding 5 files and 5 shortcuts to folders chosen at random.
+    '''
+    root = filesystem.Folder('root', '')
+    folders = []
+    for i in range(40 * scale):
+        outer = filesystem.Folder(f"s{i}", root)
+        root.add_branch(outer)
+        for j in range(50):
+            folder = filesystem.Folder(f"s{i}_{j}", outer)
+            outer.add_branch(folder)
+            folders.append(folder)
+            for k in range(5):
+                folder.add_branch(filesystem.File(f"file{k}", folder, f"content {k}"))
+    for folder in folders:
+        for k in range(5):
+            folder.add_branch(filesystem.Shortcut(f"link{k}", folder, rng.choice(folders)))
+    targets = []
+    for k in range(5):
+        i = rng.randrange(40 * scale)
+        targets.append(f"root:s{i}:s{i}_{rng.randrange(50)}:link{k}")
+    return root, targets, 'link4'
+
+def content_tree(scale, rng):
+    '''
+    20 folders of 25 files holding 16 KiB of text each, and 4 files above the blob threshold.
+    '''
+    root = filesystem.Folder('root', '')
+    words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for i in range(rng.randrange(3, 10))) for j in range(2000)]
+    for i in range(20 * scale):
+        folder = filesystem.Folder(f"docs{i}", root)
+        root.add_branch(folder)
+        for j in range(25):
+            text = ' '.join(rng.choice(words) for k in range(2800))[:16384]
+            folder.add_branch(filesystem.File(f"doc{j}.txt", folder, text))
+    large = filesystem.Folder('large', root)
+    root.add_branch(large)
+    for j in range(4):
+        large.add_branch(filesystem.File(f"blob{j}.bin", large, words[j] * (filesystem.blob_threshold // len(words[j]) + 1)))
+    targets = [f"root:docs{i}" for i in range(20 * scale)]
+    return root, targets, 'doc24.txt'
+
+GENERATORS = {
+    'wide' : wide_tree,
+    'deep' : deep_tree,
+    'shortcuts' : shortcut_tree,
+    'content' : content_tree,
+}
+# -- END TREE GENERATORS
+
+
+def install_tree(root) -> None:
+    '''
+    Makes root the filesystem, with empty history and clipboard.
+    '''
+    filesystem.filesystem = root
+    filesystem.rebuild_name_index(root)
+    filesystem.resolve_cache.clear()
+    filesystem.command_history = []
+    filesystem.object_clipboard = []
+
+def count_nodes(root) -> int:
+    count = 1
+    stack = [root]
+    while stack:
+        branches = stack.pop().get_branches()
+        count += len(branches)
+        stack.extend([obj for obj in branches if obj.type == 'folder'])
+    return count
+
+def parser_commands(targets, count, rng):
+    '''
+    Returns a mix of commands for command_parser, visiting a target folder and returning to a folder of its own.
+    '''
+    commands = ["folder ~bench", "in @bench", "file ~a #first", "file ~b #second"]
+    while len(commands) < count:
+        commands.append(f"cd @{rng.choice(targets)}")
+        commands.append("list")
+        commands.append("cd @root:bench")
+        commands.append(f"read ~{rng.choice('ab')}")
+        commands.append(f"props ~{rng.choice('ab')}")
+        commands.append(f"write ~{rng.choice('ab')} !append # line {len(commands)}")
+    return commands
+
+def run_workload(name, scale, seed) -> dict:
+    '''
+    Builds the tree named name, then times each operation on it.
+    Returns operation name -> seconds taken.
+    '''
+    rng = random.Random(seed)
+    timings = {}
+    filesystem.batch_errors = []
+
+    def timed(operation, function, *args, **kwargs):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        timings[operation] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    root, targets, search_name = GENERATORS[name](scale, rng)
+    install_tree(root)
+    timings['build'] = time.perf_counter() - start
+
+    snapshot_file = f"{name}.txt"
+    history_file = f"{name}_history.txt"
+    for path in (snapshot_file, history_file):
+        if os.path.exists(path):
+            os.remove(path)
+    timed('save', filesystem.save_filesystem, snapshot_file)
+    timed('save_history', filesystem.save_filesystem, history_file, augment = 'history')
+    # searches take a few milliseconds, so are repeated to be measured above timer noise
+    timed('search_filesystem', lambda: [filesystem.search_filesystem(root, search_name) for i in range(10)])
+    timed('search_index', lambda: [filesystem.search_index(root, search_name) for i in range(10)])
+
+    filesystem.command_history = []
+    timed('change_directory', filesystem.change_directory, targets * (2000 // len(targets) + 1))
+
+    # pastes the largest folder below the root into a folder of its own, ten times over
+    filesystem.filesystem = root
+    largest = max([obj for obj in root.get_branches() if obj.type == 'folder'], key = lambda obj: len(obj.get_branches()))
+    filesystem.copy_objects([largest.name])
+    filesystem.create_folder(['pasted'])
+    filesystem.filesystem = root.get_branch('pasted')
+    def paste_ten():
+        for i in range(10):
+            filesystem.paste_objects()
+    timed('paste_objects', paste_ten)
+
+    # appends to one file of a pasted folder, which first copies the shared content
+    stack = [root.get_branch('pasted')]
+    while not any(obj.type == 'file' for obj in stack[-1].get_branches()):
+        stack.extend([obj for obj in stack.pop().get_branches() if obj.type == 'folder'])
+    filesystem.filesystem = stack[-1]
+    append_name = next(obj.name for obj in filesystem.filesystem.get_branches() if obj.type == 'file')
+    def append_loop():
+        for i in range(5000):
+            filesystem.write_files([append_name], 'append', [f" appended line {i}"])
+    timed('write_files_append', append_loop)
+
+    filesystem.filesystem = root
+    commands = parser_commands(targets, 5000, rng)
+    def parse_all():
+        for command in commands:
+            filesystem.command_parser(command)
+    timed('command_parser', parse_all)
+    timings['command_parser_per_s'] = len(commands) / timings['command_parser']
+
+    timed('load', filesystem.load_filesystem, snapshot_file)
+    timed('load_lazy', filesystem.load_filesystem, snapshot_file, 'lazy')
+    if name != 'content':
+        # replaying the history of large content files is dominated by escaping, which is measured by save_history
+        filesystem.filesystem = filesystem.Folder('root', '')
+        install_tree(filesystem.filesystem)
+        timed('load_history', filesystem.load_filesystem, history_file)
+    # errors would mean an operation did less work than intended, and are reported alongside the timings
+    timings['errors'] = len(filesystem.batch_errors)
+    timings['nodes'] = count_nodes(root)
+    timings['snapshot_bytes'] = os.path.getsize(snapshot_file)
+    return timings
+
+def summarise(runs) -> dict:
+    '''
+    Reduces the timings of repeated runs to the best and median value of each operation.
+    '''
+    summary = {}
+    for operation in runs[0]:
+        values = sorted(run[operation] for run in runs)
+        best = values[-1] if operation.endswith('_per_s') else values[0]
+        summary[operation] = {'best' : best, 'median' : values[len(values) // 2], 'runs' : values}
+    return summary
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd = ROOT, capture_output = True,
+                              text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+def compare(results, previous) -> int:
+    '''
+    Prints the change of each best time against previous results. Returns the number of regressions.
+    '''
+    regressions = 0
+    print(f"\ncompared with {previous.get('commit') or 'previous run'}:")
+    for workload, operations in results['workloads'].items():
+        for operation, values in operations.items():
+            old = previous.get('workloads', {}).get(workload, {}).get(operation)
+            if not old or operation in ('nodes', 'snapshot_bytes', 'errors') or operation.endswith('_per_s'):
+                continue
+            change = values['best'] / old['best'] - 1 if old['best'] else 0
+            regressed = change > REGRESSION_MARGIN
+            regressions += regressed
+            print(f"  {workload:10s} {operation:20s} {old['best'] * 1000:10.2f} ms -> {values['best'] * 1000:10.2f} ms  "
+                  f"{change:+7.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description = "Times core filesystem operations on synthetic trees.")
+    arg_parser.add_argument('--scale', type = int, default = 1, help = "multiplies the size of every tree")
+    arg_parser.add_argument('--repeat', type = int, default = 3, help = "runs of each workload, of which the best is kept")
+    arg_parser.add_argument('--workload', action = 'append', choices = list(GENERATORS), help = "workloads to run, all by default")
+    arg_parser.add_argument('--seed', type = int, default = 0)
+    arg_parser.add_argument('--output', default = 'bench_results.json', help = "file the JSON results are written to")
+    arg_parser.add_argument('--compare', help = "JSON results of an earlier run to compare with")
+    cli_args = arg_parser.parse_args()
+
+    filesystem.set_output_sink(filesystem.SilentSink())
+    filesystem.batch_answer = True
+    output_path = os.path.abspath(cli_args.output)
+    results = {
+        'commit' : git_commit(),
+        'python' : platform.python_version(),
+        'platform' : platform.platform(),
+        'cpus' : os.cpu_count(),
+        'scale' : cli_args.scale,
+        'repeat' : cli_args.repeat,
+        'seed' : cli_args.seed,
+        'workloads' : {},
+    }
+    # save_filesystem writes to the working directory, so the runs take place in a scratch directory
+    with tempfile.TemporaryDirectory() as work_dir:
+        previous_dir = os.getcwd()
+        os.chdir(work_dir)
+        try:
+            for workload in cli_args.workload or GENERATORS:
+                runs = [run_workload(workload, cli_args.scale, cli_args.seed) for i in range(cli_args.repeat)]
+                results['workloads'][workload] = summarise(runs)
+                print(f"{workload}: {int(runs[0]['nodes']):,} nodes, {int(runs[0]['errors'])} errors")
+                for operation, values in results['workloads'][workload].items():
+                    if operation in ('nodes', 'snapshot_bytes', 'errors'):
+                        continue
+                    if operation.endswith('_per_s'):
+                        print(f"  {operation:20s} {values['best']:12,.0f}")
+                    else:
+                        print(f"  {operation:20s} {values['best'] * 1000:12.2f} ms")
+        finally:
+            os.chdir(previous_dir)
+
+    with open(output_path, 'w', encoding = 'utf-8') as file:
+        json.dump(results, file, indent = 2)
+    print(f"results written to {output_path}")
+
+    if cli_args.compare:
+        with open(cli_args.compare, 'r', encoding = 'utf-8') as file:
+            regressions = compare(results, json.load(file))
+        sys.exit(1 if regressions else 0)
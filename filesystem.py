@@ -1,7 +1,24 @@
 
 import os # to check source file exists
-import re # to sanitise user commands
-import copy # to pass objects by value
+import sys # to read batch commands from stdin
+import argparse # to read command line options
+import re # to tokenize user commands
+import time # to measure replay time
+import json # to write output events as JSON lines
+import bisect # to find chunks of file content by offset
+import mmap # to read file content from the blob store
+import tempfile # to hold the blob store
+import io # to collect the output of server commands
+import asyncio # to serve many sessions at once
+import contextlib # to hold the engine lock in with blocks
+import threading # to run read-only commands in parallel
+import concurrent.futures # to run commands on a pool of threads, and searches on a pool of processes
+import multiprocessing # to start search processes without forking threads
+import zlib # to checksum journal records
+import itertools # to read a counted number of save file records
+import tarfile # to export the filesystem as a tar archive
+import weakref # to find the save files still being read from
+from collections import OrderedDict
 
 # CLASS DECLARATIONS
 class Node:
@@ -9,11 +26,20 @@ class Node:
     Basic filesystem object. Has attributes for name and type strings, 
     and reference to object it exists in context of. Can also be 
     queried for its address within the filesystem.
+    Attributes are held in __slots__ rather than a __dict__ for each object,
+    and type is shared by every object of a class.
     '''
+    __slots__ = ('name', 'context', 'cached_address', 'cached_address_string', 'cache_generation')
+    type = 'node'
+
     def __init__(self, name, context) -> None:
-        self.name = name
-        self.type = 'node'
+        # names repeat between folders, so equal names share one string
+        self.name = sys.intern(name)
         self.context = context
+        # address is cached until address_generation moves on
+        self.cached_address = ()
+        self.cached_address_string = ''
+        self.cache_generation = -1
 
     def __str__(self):
         return self.name
@@ -25,50 +51,80 @@ class Node:
         location (for shortcuts) and generates a new object with corresponding 
         class and attributes within the current working directory.
         '''
+        prepare_mutation(self)
         if type == 'file':
-            self.branches.append(File(name, self, content))
-            print(f"New file {name} created within {self.name}.")
+            obj = File(name, self, content)
         elif type == 'folder':
-            self.branches.append(Folder(name, self))
-            print(f"New folder {name} created within {self.name}.")
+            obj = Folder(name, self)
         elif type == 'shortcut':  
             if not location:
                 location = self
-            self.branches.append(Shortcut(name, self, location))
-            print(f"New shortcut {name} created within {self.name}.")
+            obj = Shortcut(name, self, location)
         else:
-            print(f"{type} is not a recognized node type.")
+            print_error(f"{type} is not a recognized node type.")
+            return
+        self.add_branch(obj)
+        index_subtree(obj)
+        emit('created', f"New {type} {name} created within {self.name}.", type = type, name = name, context = self.name)
 
     def get_address(self, string = False):
         '''
-        Returns address of current object as a list, beginning with 
+        Returns address of current object as a tuple, beginning with 
         name of root object and followed by names of progressively 
         smaller contexts, terminating with name of current object.
+        Addresses are cached, and only recalculated after an object has been renamed or relocated.
         '''
-        context_list = [self.name]
-        curr_context = self.context
-        # loops until counters empty context
-        while curr_context:
-            # appends name of context to context_list
-            context_list.append(curr_context.name)
-            # moves up one level of context
-            curr_context = curr_context.context
-        address = context_list[::-1]
+        if self.cache_generation != address_generation:
+            # collect objects up to the nearest context with a valid cached address
+            stale_list = []
+            curr_context = self
+            while curr_context and curr_context.cache_generation != address_generation:
+                stale_list.append(curr_context)
+                curr_context = curr_context.context
+            address = curr_context.cached_address if curr_context else ()
+            # recalculate addresses on the way back down
+            for obj in reversed(stale_list):
+                address = address + (obj.name,)
+                obj.cached_address = address
+                obj.cached_address_string = ''
+                obj.cache_generation = address_generation
 
         # allow obtaining address as string
         if string:
-            return ':'.join(address)
-        return address
+            if not self.cached_address_string:
+                self.cached_address_string = ':'.join(self.cached_address)
+            return self.cached_address_string
+        return self.cached_address
+
+    def get_depth(self) -> int:
+        '''
+        Returns number of contexts above current object.
+        '''
+        return len(self.get_address()) - 1
 
 class Folder(Node):
     '''
     Class for storing other objects within its context.
-    Stores references to objects as list indices witin branches attribute.
+    Stores references to objects as list indices witin branches attribute,
+    and indexes the same references by name within branch_index attribute.
+    A folder created by clone stays empty, with a reference to its clone source, until
+    its objects are first accessed. It is then filled with clones of the source's objects.
+    Folders of a save file loaded lazily wait in the same way, with a SnapshotFolder as clone source.
     '''
+    __slots__ = ('branches', 'branch_index', 'clone_source', 'clone_dependents', 'clone_roots')
+    type = 'folder'
+
     def __init__(self, name, context) -> None:
         Node.__init__(self, name, context)
         self.branches = []
-        self.type = 'folder'
+        # name -> object hash kept in sync with branches for constant time lookups
+        self.branch_index = {}
+        # folder this folder is a lazy clone of, and list of lazy clones of this folder once it has any
+        self.clone_source = None
+        self.clone_dependents = None
+        # CloneRoot of each clone this lazy clone belongs to, innermost first,
+        # through which the shortcuts it is filled with are retargeted
+        self.clone_roots = None
         
     '''
     returns list of stored object references whose names match indices in passed
@@ -76,59 +132,1061 @@ class Folder(Node):
     '''
     def get_name_matches(self, name_list) -> list:
         # return list of references to objects in folder whose names are in name_list
+        if self.clone_source is not None:
+            self.materialize()
         matches = []
+        absent_names = []
 
         for name in name_list:
-            for object in self.branches:
-                if object.name == name:
-                    matches.append(object)
-                    break
+            obj = self.branch_index.get(name)
+            if obj is None:
+                absent_names.append(name)
+            else:
+                matches.append(obj)
 
-        match_names = [obj.name for obj in matches]
-        absent_names = [name for name in name_list if name not in match_names]
         return matches, absent_names
 
     def get_branches(self) -> list:
+        if self.clone_source is not None:
+            self.materialize()
         return self.branches
 
+    def get_branch(self, name):
+        '''
+        Returns reference to stored object with name name, or None if no such object exists.
+        '''
+        if self.clone_source is not None:
+            self.materialize()
+        return self.branch_index.get(name)
+
+    def add_branch(self, obj) -> None:
+        if self.clone_source is not None:
+            self.materialize()
+        # every change to branches must also be made to branch_index
+        self.branches.append(obj)
+        self.branch_index[obj.name] = obj
+
+    def remove_branch(self, obj) -> None:
+        if self.clone_source is not None:
+            self.materialize()
+        self.branches.remove(obj)
+        del self.branch_index[obj.name]
+
+    def rename_branch(self, obj, new_name) -> None:
+        if self.clone_source is not None:
+            self.materialize()
+        # object keeps its position in branches, only its index key changes
+        del self.branch_index[obj.name]
+        obj.name = sys.intern(new_name)
+        self.branch_index[obj.name] = obj
+
+    def free_name(self, name, suffix) -> str:
+        '''
+        Mutates name with suffix until no stored object possesses it.
+        '''
+        if self.clone_source is not None:
+            self.materialize()
+        while name in self.branch_index:
+            name += suffix
+        return name
+
+    def clone(self, name, context):
+        '''
+        Returns a folder with name name in context that holds the same objects as this folder,
+        without copying any objects until the clone is accessed.
+        '''
+        clone = Folder(name, context)
+        source = self.shared_source()
+        clone.clone_source = source
+        if source is not self:
+            # objects of the shared source are retargeted to this folder's objects first
+            clone.clone_roots = self.clone_roots
+        if source.clone_dependents is None:
+            source.clone_dependents = []
+        source.clone_dependents.append(clone)
+        return clone
+
+    def shared_source(self):
+        # a lazy clone holds the same objects as its source, so its clones can share that source
+        # folders still to be read from a save file are their own source, as each read makes new objects
+        return self.clone_source if isinstance(self.clone_source, Folder) else self
+
+    def fill(self, clone) -> None:
+        # fills a lazy clone of this folder with clones of its objects
+        roots = clone.clone_roots
+        branches = self.get_branches()
+        for obj in branches:
+            obj_clone = obj.clone(obj.name, clone)
+            if roots is not None and obj_clone.type == 'folder':
+                obj_clone.clone_roots = (obj_clone.clone_roots or ()) + roots
+            clone.branches.append(obj_clone)
+            clone.branch_index[obj_clone.name] = obj_clone
+        if roots is not None:
+            # recorded so that shortcuts can find the clones of the objects they refer to
+            roots[-1].fills[clone] = (self, tuple(branches), tuple(clone.branches))
+
+    def materialize(self) -> None:
+        '''
+        Fills a lazy clone with clones of the objects in its clone source, or a folder still to be read
+        from a save file with the objects read from it. Shortcuts it is filled with are then retargeted
+        through clone_roots.
+        If the folder is waiting in pending_clones, its new objects are added to name_index.
+        '''
+        with cache_lock:
+            # another thread may have materialized the folder while this one waited for the lock,
+            # or this thread may reach it again while retargeting its shortcuts
+            source = self.clone_source
+            if source is None or source is self:
+                return
+            self.clone_source = self
+            source.fill(self)
+            if self.clone_roots is not None:
+                retarget_shortcuts(self, self.clone_roots)
+                self.clone_roots = None
+            # cleared once the folder is filled, as other threads read the folder without the lock
+            self.clone_source = None
+            if self in pending_clones:
+                pending_clones.discard(self)
+                for obj in self.branches:
+                    index_subtree(obj)
+
+class CloneRoot:
+    '''
+    Records a clone made by clone_subtree, so that shortcuts within the clone can be made to refer to
+    objects within it as its lazy folders are filled. fills maps each folder of the clone filled so far
+    to the folder it was filled from, that folder's objects and their clones, matched by position.
+    Only kept while folders of the clone are still to be filled.
+    '''
+    __slots__ = ('clone', 'source', 'fills')
+
+    def __init__(self, clone, source) -> None:
+        self.clone = clone
+        self.source = source
+        self.fills = {}
+
 class File(Node):
     '''
     Class for storing user-defined data in string format.
+    Data is held in a ContentBuffer, and can be read and replaced as a string through the content attribute.
     '''
+    __slots__ = ('buffer', 'shared_buffer')
+    type = 'file'
+
     def __init__(self, name, context, content) -> None:
         Node.__init__(self, name, context)
-        self.type = 'file'
-        self.content = content
+        self.buffer = ContentBuffer(content)
+        # true if buffer may also belong to a clone, so must be copied before it is changed
+        self.shared_buffer = False
+
+    @property
+    def content(self) -> str:
+        return self.buffer.read()
+
+    @content.setter
+    def content(self, content) -> None:
+        self.buffer = ContentBuffer(content)
+        self.shared_buffer = False
+
+    def clone(self, name, context):
+        '''
+        Returns a file with name name in context that shares this file's content until either file is written to.
+        '''
+        clone = File(name, context, '')
+        clone.buffer = self.buffer
+        clone.shared_buffer = self.shared_buffer = True
+        return clone
+
+    def get_content(self, start = 0, end = None) -> str:
+        return self.buffer.read(start, end)
+
+    def get_view(self, start = 0, end = None):
+        return self.buffer.read_view(start, end)
+
+    def append_content(self, content) -> None:
+        if self.shared_buffer:
+            self.buffer = self.buffer.copy()
+            self.shared_buffer = False
+        self.buffer.append(content)
 
-    def get_content(self) -> list:
-        return self.content
+    def get_size(self) -> int:
+        return len(self.buffer)
 
-class Shortcut(Folder):
+class ContentBuffer:
     '''
-    Child class of folder with a single location in its context.
+    Stores text as a list of UTF-8 encoded chunks, so that appending text never copies existing text.
+    Keeps the length of the text in characters, and the byte offset at which each chunk ends.
+    Once the chunks held in memory exceed blob_threshold bytes, they are moved to blob_store
+    and replaced by a single BlobSegment.
+    '''
+    __slots__ = ('chunks', 'chunk_ends', 'byte_size', 'char_size', 'memory_size')
+
+    def __init__(self, text = '') -> None:
+        self.chunks = []
+        self.chunk_ends = []
+        self.byte_size = 0
+        self.char_size = 0
+        # bytes held by chunks in memory, which are always the last chunks
+        self.memory_size = 0
+        if text:
+            self.append(text)
+
+    def __len__(self) -> int:
+        return self.char_size
+
+    def append(self, text) -> None:
+        data = text.encode('utf-8')
+        self.chunks.append(data)
+        self.byte_size += len(data)
+        self.chunk_ends.append(self.byte_size)
+        self.char_size += len(text)
+        self.memory_size += len(data)
+        if self.memory_size > blob_threshold:
+            self.spill()
+
+    @classmethod
+    def from_bytes(cls, data, char_size):
+        # buffer holding data, which must be valid UTF-8 of char_size characters, without decoding it again
+        buffer = cls()
+        if data:
+            buffer.chunks.append(data)
+            buffer.byte_size = buffer.memory_size = len(data)
+            buffer.chunk_ends.append(buffer.byte_size)
+            buffer.char_size = char_size
+            if buffer.memory_size > blob_threshold:
+                buffer.spill()
+        return buffer
+
+    def copy(self):
+        # chunks are never changed once created, so only the lists holding them are copied
+        buffer = ContentBuffer()
+        buffer.chunks = self.chunks.copy()
+        buffer.chunk_ends = self.chunk_ends.copy()
+        buffer.byte_size = self.byte_size
+        buffer.char_size = self.char_size
+        buffer.memory_size = self.memory_size
+        return buffer
+
+    def spill(self) -> None:
+        # replace all chunks held in memory with one segment in the blob store
+        memory_count = 0
+        for chunk in reversed(self.chunks):
+            if isinstance(chunk, BlobSegment):
+                break
+            memory_count += 1
+        data = b''.join(self.chunks[-memory_count:])
+        segment = get_blob_store().put(data)
+        del self.chunks[-memory_count:]
+        del self.chunk_ends[-memory_count:]
+        self.chunks.append(segment)
+        self.chunk_ends.append(self.byte_size)
+        self.memory_size = 0
+
+    def get_chunks(self):
+        # a reader joining chunks replaces both lists, so they are taken together
+        with cache_lock:
+            return self.chunks, self.chunk_ends
+
+    def get_chunk_data(self, chunk):
+        # bytes of chunk in memory, or a memoryview of chunk in the blob store
+        if isinstance(chunk, BlobSegment):
+            return get_blob_store().view(chunk)
+        return chunk
+
+    def read_view(self, start = 0, end = None):
+        '''
+        Returns data between byte offsets start and end, or all data if no offsets are passed.
+        Data within a single chunk is returned without copying, as a memoryview of the chunk.
+        '''
+        if end is None or end > self.byte_size:
+            end = self.byte_size
+        if start >= end:
+            return memoryview(b'')
+
+        # find chunk containing start, then take slices until end
+        chunks, chunk_ends = self.get_chunks()
+        index = bisect.bisect_right(chunk_ends, start)
+        chunk_start = chunk_ends[index - 1] if index else 0
+        pieces = []
+        while chunk_start < end:
+            data = memoryview(self.get_chunk_data(chunks[index]))
+            pieces.append(data[max(start - chunk_start, 0):end - chunk_start])
+            chunk_start = chunk_ends[index]
+            index += 1
+        if len(pieces) == 1:
+            return pieces[0]
+        return memoryview(b''.join(pieces))
+
+    def read(self, start = 0, end = None) -> str:
+        '''
+        Returns text between byte offsets start and end, or all text if no offsets are passed.
+        Characters cut by either offset are replaced.
+        '''
+        whole = start == 0 and (end is None or end >= self.byte_size)
+        if whole and len(self.chunks) > 1 and self.memory_size == self.byte_size:
+            # reading all text held in memory joins the chunks, so later reads take a single slice
+            with cache_lock:
+                self.chunks, self.chunk_ends = [b''.join(self.chunks)], [self.byte_size]
+        return str(self.read_view(start, end), 'utf-8', 'replace')
+
+    def iter_text(self):
+        # chunks always hold whole characters, as they are only ever created from whole strings
+        for chunk in self.get_chunks()[0]:
+            yield str(self.get_chunk_data(chunk), 'utf-8')
+
+class ContentEntry:
+    '''
+    History entry of a command whose content arguments are read from file content when the entry is
+    turned into text, so that history holds no copy of content that is kept in memory or in blob_store.
+    Each piece of content is a string, or the ContentBuffer and byte offsets the content was written to.
+    Content buffers never change the bytes they already hold, so each piece reads back as it was written.
+    '''
+    __slots__ = ('prefix', 'pieces')
+
+    def __init__(self, prefix, pieces) -> None:
+        self.prefix = prefix
+        self.pieces = pieces
+
+    def __str__(self) -> str:
+        contents = [piece if isinstance(piece, str) else piece[0].read(piece[1], piece[2]) for piece in self.pieces]
+        return f"{self.prefix} #{'|'.join([escape_arg(content) for content in contents])}"
+
+class BlobSegment:
+    '''
+    Reference to data written to blob_store, by its offset and length.
+    Data in the blob store never changes, so segments can be shared rather than copied.
+    The offset only changes when the blob store is compacted, which moves the data without changing it.
+    '''
+    __slots__ = ('offset', 'length', '__weakref__')
+
+    def __init__(self, offset, length) -> None:
+        self.offset = offset
+        self.length = length
+
+class BlobStore:
+    '''
+    Append-only store for large file content, held in a temporary file on disk and read through mmap.
+    The file is deleted when the store is closed or the program ends.
+    Data no buffer refers to any more is dropped once it takes up more of the file than the data still
+    referred to, by copying the data still referred to into a new file.
+    '''
+    def __init__(self, directory = None) -> None:
+        self.directory = directory
+        self.file = tempfile.TemporaryFile(dir = directory)
+        self.size = 0
+        self.map = None
+        # segments still referred to by a buffer, which are dropped from the set as they are freed
+        self.segments = weakref.WeakSet()
+        # held while data is written, moved or viewed, as compacting changes the offsets of segments
+        self.lock = threading.RLock()
+
+    def put(self, data):
+        # write data to end of file, returning a segment referring to it
+        with self.lock:
+            live_size = sum(segment.length for segment in self.segments)
+            if self.size - live_size > live_size:
+                self.compact()
+            segment = BlobSegment(self.size, len(data))
+            self.file.seek(self.size)
+            self.file.write(data)
+            self.size += len(data)
+            self.segments.add(segment)
+            return segment
+
+    def compact(self) -> None:
+        '''
+        Copies the data of every segment still referred to into a new file, in order, and replaces the file.
+        Views of the old file stay valid, as earlier maps stay open for as long as views of them exist.
+        '''
+        with self.lock:
+            file = tempfile.TemporaryFile(dir = self.directory)
+            size = 0
+            for segment in sorted(self.segments, key = lambda segment: segment.offset):
+                file.write(self.view(segment))
+                segment.offset = size
+                size += segment.length
+            self.file.close()
+            self.file = file
+            self.size = size
+            self.map = None
+
+    def view(self, segment):
+        with self.lock:
+            offset, length = segment.offset, segment.length
+            # map the file again once it has grown past the current map
+            # earlier maps stay open for as long as views of them exist
+            if self.map is None or len(self.map) < offset + length:
+                self.file.flush()
+                self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+            return memoryview(self.map)[offset:offset + length]
+
+class ContentReader(io.RawIOBase):
+    '''
+    Readable binary stream of the data in a ContentBuffer, taken a chunk at a time
+    so that content is streamed to an archive without being joined in memory.
+    '''
+    def __init__(self, buffer) -> None:
+        io.RawIOBase.__init__(self)
+        self.buffer = buffer
+        self.chunks = iter(buffer.get_chunks()[0])
+        self.data = memoryview(b'')
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        while not self.data:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return 0
+            self.data = memoryview(self.buffer.get_chunk_data(chunk))
+        size = min(len(target), len(self.data))
+        target[:size] = self.data[:size]
+        self.data = self.data[size:]
+        return size
+
+class Shortcut(Node):
+    '''
+    Object holding a single location in its context.
     When a shortcut is made the working directory, the program automatically 
     makes the object at the stored location it the working directory.
     '''
+    __slots__ = ('location', 'target_cache')
+    type = 'shortcut'
+
     def __init__(self, name, context, location) -> None:
-        Folder.__init__(self, name, context)
-        self.branches = [location]
-        self.type = 'shortcut'
+        Node.__init__(self, name, context)
+        self.location = location
+        # (shortcut_generation, location, target) when the target of location was last found
+        self.target_cache = None
+
+    @property
+    def branches(self) -> list:
+        # location was once held as the only branch of a folder
+        return [self.location]
+
+    def clone(self, name, context):
+        return Shortcut(name, context, self.location)
+
+class SnapshotReader:
+    '''
+    Reads the records of a save file written by write_snapshot on demand, through the table of
+    record offsets at the end of the file, so that folders can be filled the first time they are accessed.
+    Objects read from the file are kept by id, so that shortcuts can find the objects they refer to.
+    '''
+    def __init__(self, filename) -> None:
+        self.file = open(filename, 'rb')
+        if self.file.readline().rstrip(b'\n').decode('utf-8') != SNAPSHOT_HEADER:
+            raise ValueError(f"{filename} is not an indexed save file.")
+        self.cwd_id = int(self.file.readline())
+        self.count = int(self.file.readline())
+        # the last line holds the offset of the table, which holds one fixed width line per record
+        self.file.seek(-SNAPSHOT_OFFSET_WIDTH, os.SEEK_END)
+        self.table_offset = int(self.file.read(SNAPSHOT_OFFSET_WIDTH), 16)
+        # id -> object, for every object read so far
+        self.objects = {}
+        snapshot_readers.add(self)
+
+    def read_records(self, first, count) -> list:
+        # records of the objects in a folder are consecutive, so are read with one seek
+        self.file.seek(self.table_offset + first * SNAPSHOT_OFFSET_WIDTH)
+        self.file.seek(int(self.file.read(SNAPSHOT_OFFSET_WIDTH), 16))
+        return [self.file.readline().rstrip(b'\n').decode('utf-8').split('\t') for i in range(count)]
+
+    def read_root(self):
+        obj_id, parent_id, type, name, payload = self.read_records(0, 1)[0]
+        root = Folder(snapshot_unescape(name), '')
+        self.objects[0] = root
+        first, count = map(int, payload.split())
+        if count:
+            root.clone_source = SnapshotFolder(self, first, count)
+        return root
+
+    def detach(self) -> None:
+        '''
+        Reads the whole file into memory and closes it, so that the file can be replaced.
+        Called with cache_lock held.
+        '''
+        self.file.seek(0)
+        content = self.file.read()
+        self.file.close()
+        self.file = io.BytesIO(content)
+        snapshot_readers.discard(self)
+
+    def find(self, obj_id):
+        '''
+        Returns the object read from the record with id obj_id, filling the folders that contain it.
+        '''
+        # ids of the object and the objects containing it, up to the first that has been read
+        path = []
+        while obj_id not in self.objects:
+            path.append(obj_id)
+            obj_id = int(self.read_records(obj_id, 1)[0][1])
+        for obj_id in reversed(path):
+            # filling the containing folder reads the object
+            self.objects[int(self.read_records(obj_id, 1)[0][1])].get_branches()
+        return self.objects[obj_id]
+
+class SnapshotFolder:
+    '''
+    Stands as the clone source of a folder whose objects have not yet been read from a save file.
+    first and count locate the records of those objects in reader.
+    '''
+    __slots__ = ('reader', 'first', 'count')
+
+    def __init__(self, reader, first, count) -> None:
+        self.reader = reader
+        self.first = first
+        self.count = count
+
+    def fill(self, folder) -> None:
+        '''
+        Creates the objects of folder from their records. Called by materialize with cache_lock held.
+        '''
+        reader = self.reader
+        shortcuts = []
+        for obj_id, record in enumerate(reader.read_records(self.first, self.count), self.first):
+            type, name, payload = record[2], snapshot_unescape(record[3]), record[4]
+            if type == 'file':
+                obj = File(name, folder, snapshot_unescape(payload))
+            elif type == 'shortcut':
+                # shortcuts refer to their own context until the object they refer to is found
+                obj = Shortcut(name, folder, folder)
+                shortcuts.append((obj, payload))
+            else:
+                obj = Folder(name, folder)
+                first, count = map(int, payload.split())
+                if count:
+                    obj.clone_source = SnapshotFolder(reader, first, count)
+            folder.branches.append(obj)
+            folder.branch_index[obj.name] = obj
+            reader.objects[obj_id] = obj
+        # the folder is complete, so finding the objects shortcuts refer to may read through it
+        folder.clone_source = None
+        for obj, payload in shortcuts:
+            obj.location = read_shortcut_location(payload, reader.find) or folder
+
+# OUTPUT SINKS
+class TextSink:
+    '''
+    Prints the text of each output event to a stream, as commands have always printed to the terminal.
+    If no stream is passed, prints to the current stdout.
+    '''
+    def __init__(self, stream = None) -> None:
+        self.stream = stream
+
+    def write(self, event) -> None:
+        print(event['text'], file = self.stream or sys.stdout)
+
+class SilentSink:
+    '''
+    Discards all output events.
+    '''
+    def write(self, event) -> None:
+        pass
+
+class BufferedTextSink:
+    '''
+    Collects the text of output events, to be written to a stream in one call by flush.
+    '''
+    def __init__(self, stream = None) -> None:
+        self.stream = stream
+        self.lines = []
+
+    def write(self, event) -> None:
+        self.lines.append(event['text'])
+
+    def getvalue(self) -> str:
+        return ''.join([line + '\n' for line in self.lines])
+
+    def flush(self) -> None:
+        (self.stream or sys.stdout).write(self.getvalue())
+        self.lines = []
+
+class JsonLinesSink:
+    '''
+    Writes each output event to a stream as a JSON object on its own line.
+    '''
+    def __init__(self, stream = None) -> None:
+        self.stream = stream
+
+    def write(self, event) -> None:
+        (self.stream or sys.stdout).write(json.dumps(event) + '\n')
+
+# COMMAND STATISTICS
+class CommandStats:
+    '''
+    Records the latency of each command as a histogram, with its number of calls, and counters
+    added while the command runs, such as nodes visited and bytes written.
+    Held by command_stats while statistics are enabled. When disabled, command_stats is None,
+    and instrumented code pays for a single comparison.
+    '''
+    def __init__(self) -> None:
+        # command -> {'calls', 'seconds', 'max', 'histogram', 'counters'}
+        self.commands = {}
+        self.started = time.time()
+        self.lock = threading.Lock()
+        # the command running on each thread, which counters are added to
+        self.local = threading.local()
+
+    def record(self, command):
+        record = self.commands.get(command)
+        if record is None:
+            record = {'calls' : 0, 'seconds' : 0.0, 'max' : 0.0, 'histogram' : [0] * (len(STATS_BUCKETS) + 1), 'counters' : {}}
+            self.commands[command] = record
+        return record
+
+    def run(self, command, function, *args):
+        '''
+        Calls function with args, timing the call as one call of command.
+        '''
+        outer = getattr(self.local, 'command', None)
+        self.local.command = command
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.local.command = outer
+            with self.lock:
+                record = self.record(command)
+                record['calls'] += 1
+                record['seconds'] += elapsed
+                record['max'] = max(record['max'], elapsed)
+                record['histogram'][bisect.bisect_left(STATS_BUCKETS, elapsed)] += 1
+
+    def add(self, counter, amount = 1) -> None:
+        # counters added outside a command, such as while loading at startup, are kept under 'other'
+        command = getattr(self.local, 'command', None) or 'other'
+        with self.lock:
+            counters = self.record(command)['counters']
+            counters[counter] = counters.get(counter, 0) + amount
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            commands = {command : {'calls' : record['calls'], 'seconds' : record['seconds'], 'max' : record['max'],
+                                   'histogram' : list(record['histogram']), 'counters' : dict(record['counters'])}
+                        for command, record in self.commands.items()}
+        return {'since' : self.started, 'buckets' : STATS_BUCKETS, 'commands' : commands}
+
+    def report(self) -> str:
+        '''
+        Returns a table of the calls, mean and maximum latency, latency histogram and counters of each command.
+        '''
+        stats = self.as_dict()
+        bucket_names = [f"<{format_seconds(bound)}" for bound in STATS_BUCKETS] + [f">={format_seconds(STATS_BUCKETS[-1])}"]
+        lines = [f"Statistics for {time.time() - self.started:.1f} s:",
+                 f"{'command':10s} {'calls':>8s} {'mean':>9s} {'max':>9s}  " + ' '.join([f"{name:>7s}" for name in bucket_names])]
+        for command, record in sorted(stats['commands'].items()):
+            mean = record['seconds'] / record['calls'] if record['calls'] else 0
+            lines.append(f"{command:10s} {record['calls']:8d} {format_seconds(mean):>9s} {format_seconds(record['max']):>9s}  "
+                         + ' '.join([f"{count:7d}" for count in record['histogram']]))
+            for counter, total in sorted(record['counters'].items()):
+                per_call = f" ({total / record['calls']:,.1f} per call)" if record['calls'] else ''
+                lines.append(f"    {counter}: {total:,}{per_call}")
+        return '\n'.join(lines)
+
+def format_seconds(seconds) -> str:
+    if seconds >= 1:
+        return f"{seconds:.3g}s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.3g}ms"
+    return f"{seconds * 1e6:.3g}us"
+
+# WRITE-AHEAD JOURNAL
+class Journal:
+    '''
+    Appends the history entries of each command that changes the filesystem to a journal file in directory,
+    so that the filesystem can be recovered after a crash from the latest checkpoint and the journal that follows it.
+    Each record is a line holding a checksum and the JSON of the working directory address and the entries.
+    Records are fsynced in groups of group_size, or once interval seconds have passed since the last sync.
+    Every checkpoint_every records, the filesystem is written to a new checkpoint and a new journal is begun,
+    and the files of the previous generation are removed.
+    '''
+    def __init__(self, directory, generation, group_size = 1, interval = 0.0, checkpoint_every = 10000) -> None:
+        self.directory = directory
+        self.generation = generation
+        self.group_size = group_size
+        self.interval = interval
+        self.checkpoint_every = checkpoint_every
+        # records written since the last sync, and since the last checkpoint
+        self.pending = 0
+        self.records = 0
+        self.last_sync = time.monotonic()
+        self.lock = threading.Lock()
+        # number of commands being journaled, as commands such as load run further commands
+        self.depth = 0
+        self.file = open(journal_path(directory, 'journal', generation), 'ab')
+        self.stopped = threading.Event()
+        self.flusher = None
+        if interval > 0:
+            # records of a quiet session are synced without waiting for the next command
+            self.flusher = threading.Thread(target = self.flush_loop, daemon = True)
+            self.flusher.start()
+
+    def append(self, address, entries) -> None:
+        data = json.dumps([address, entries]).encode('utf-8')
+        with self.lock:
+            self.file.write(b'%08x %s\n' % (zlib.crc32(data), data))
+            self.pending += 1
+            self.records += 1
+            if self.pending >= self.group_size or (self.interval and time.monotonic() - self.last_sync >= self.interval):
+                self.sync_locked()
+
+    def sync(self) -> None:
+        with self.lock:
+            self.sync_locked()
+
+    def sync_locked(self) -> None:
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+        self.last_sync = time.monotonic()
+
+    def flush_loop(self) -> None:
+        while not self.stopped.wait(self.interval):
+            with self.lock:
+                if self.pending:
+                    self.sync_locked()
+
+    def checkpoint(self, root, cwd) -> None:
+        '''
+        Writes the tree below root to the checkpoint of the next generation and begins its journal.
+        The checkpoint is complete on disk before the previous generation is removed, so a crash at any
+        point leaves one complete checkpoint with the journal that follows it.
+        '''
+        with self.lock:
+            generation = self.generation + 1
+            path = journal_path(self.directory, 'checkpoint', generation)
+            with open(path + '.tmp', 'w', encoding = 'utf-8', newline = '') as file:
+                write_snapshot(file, root, cwd)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(path + '.tmp', path)
+            new_file = open(journal_path(self.directory, 'journal', generation), 'ab')
+            sync_directory(self.directory)
+            self.sync_locked()
+            self.file.close()
+            for kind in ('checkpoint', 'journal'):
+                old_path = journal_path(self.directory, kind, self.generation)
+                if os.path.exists(old_path):
+                    os.remove(old_path)
+            self.file = new_file
+            self.generation = generation
+            self.records = 0
+
+    def close(self) -> None:
+        self.stopped.set()
+        if self.flusher:
+            self.flusher.join()
+        with self.lock:
+            self.sync_locked()
+            self.file.close()
+
+def journal_path(directory, kind, generation) -> str:
+    extension = 'txt' if kind == 'checkpoint' else 'log'
+    return os.path.join(directory, f"{kind}-{generation:06d}.{extension}")
+
+def sync_directory(directory) -> None:
+    # makes renamed and created files durable, where the platform allows directories to be opened
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+# ENGINE AND SERVER SESSIONS
+class ReadWriteLock:
+    '''
+    Lock held by any number of reader threads at once, or by a single writer thread.
+    Waiting writers hold back new readers, so that a stream of reads cannot starve a write.
+    '''
+    def __init__(self) -> None:
+        self.readers = 0
+        self.writing = False
+        self.writers_waiting = 0
+        self.condition = threading.Condition()
+
+    @contextlib.contextmanager
+    def read(self):
+        with self.condition:
+            self.condition.wait_for(lambda: not self.writing and not self.writers_waiting)
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                if not self.readers:
+                    self.condition.notify_all()
+
+    @contextlib.contextmanager
+    def write(self):
+        with self.condition:
+            self.writers_waiting += 1
+            self.condition.wait_for(lambda: not self.writing and not self.readers)
+            self.writers_waiting -= 1
+            self.writing = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.writing = False
+                self.condition.notify_all()
+
+class Session:
+    '''
+    State belonging to one client of an engine: its working directory, clipboard and command history.
+    '''
+    def __init__(self, cwd) -> None:
+        self.cwd = cwd
+        self.clipboard = []
+        self.history = []
+
+class CallContext:
+    '''
+    Working directory, history, clipboard and output of a single command. Commands in parallel_function_hash
+    take their context as an argument rather than from the module globals, so that they can run in parallel.
+    Commands that move between folders or copy objects leave the new working directory or clipboard in it.
+    '''
+    def __init__(self, cwd, sink, answer = None, line = 0, errors = None, history = None, clipboard = None) -> None:
+        self.cwd = cwd
+        self.sink = sink
+        # errors are recorded with line when answer is set, as in batch mode
+        self.answer = answer
+        self.line = line
+        self.errors = [] if errors is None else errors
+        self.history = [] if history is None else history
+        self.clipboard = [] if clipboard is None else clipboard
+
+    def emit(self, event_type, text, **fields) -> None:
+        fields['event'] = event_type
+        fields['text'] = text
+        self.sink.write(fields)
+
+    def error(self, message) -> None:
+        self.emit('error', f"Err: {message}", message = message)
+        if self.answer is not None:
+            self.errors.append((self.line, message))
+
+    def confirm(self, prompt) -> bool:
+        # the user is only asked outside batch mode
+        if self.answer is not None:
+            return self.answer
+        return confirm(prompt)
+
+class Engine:
+    '''
+    Runs commands from many sessions against one shared tree, on a pool of threads.
+    Commands in parallel_function_hash only read the tree and are passed a CallContext holding their
+    session's state, so they run concurrently as readers of the engine's lock. These include moving
+    between folders, copying, and save and export, which write the tree as it stands while writers are held off.
+    Every other command runs with its session's state swapped into the module globals: READ_COMMANDS
+    hold the lock as readers, together with a mutex that keeps the globals to one command at a time,
+    and the rest hold it as writers.
+    Each command returns its output events as JSON lines, followed by a done event holding the
+    session's address and number of errors.
+    '''
+    def __init__(self, threads = 4, answer = False) -> None:
+        self.lock = ReadWriteLock()
+        self.globals_lock = threading.Lock()
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers = threads)
+        # answer given to confirmations, as no user is asked
+        self.answer = answer
+        self.root = get_root()
+
+    def submit(self, session, args):
+        '''
+        Queues a tokenized command for session on the thread pool, and returns a future of its output.
+        '''
+        return self.pool.submit(self.execute, session, args)
+
+    def run(self, session, user_command) -> str:
+        return self.submit(session, tokenize_command(user_command)).result()
+
+    def execute(self, session, args) -> str:
+        command = args['command'] if args else None
+        stream = io.StringIO()
+        if command in parallel_function_hash:
+            with self.lock.read():
+                context = CallContext(self.find_cwd(session), JsonLinesSink(stream), self.answer,
+                                      history = session.history, clipboard = session.clipboard)
+                try:
+                    if args['untagged']:
+                        context.error("argument in input has not been prefixed with a tag.")
+                    if command_stats is None:
+                        parallel_function_hash[command](args, context)
+                    else:
+                        command_stats.run(command, parallel_function_hash[command], args, context)
+                except Exception as error:
+                    context.error(f"{type(error).__name__}: {error}")
+                finally:
+                    session.cwd = context.cwd
+                    session.history = context.history
+                    session.clipboard = context.clipboard
+                error_count = len(context.errors)
+        elif command in READ_COMMANDS:
+            with self.lock.read(), self.globals_lock:
+                error_count = self.execute_globally(session, args, stream)
+        else:
+            with self.lock.write():
+                error_count = self.execute_globally(session, args, stream)
+        done = {'event' : 'done', 'address' : session.cwd.get_address(True), 'errors' : error_count}
+        return stream.getvalue() + json.dumps(done) + '\n'
+
+    def find_cwd(self, session):
+        # another session may have deleted the working directory, or replaced the whole tree
+        if not is_held_by(session.cwd, self.root):
+            cwd = resolve(session.cwd.get_address(True), self.root)
+            # the address may now belong to an object that cannot be a working directory
+            session.cwd = cwd if cwd is not None and cwd.type == 'folder' else self.root
+        return session.cwd
+
+    def execute_globally(self, session, args, stream) -> int:
+        '''
+        Executes a tokenized command with session's state swapped into the module globals,
+        writing output events to stream. Returns the number of errors.
+        '''
+        global filesystem
+        global command_history
+        global object_clipboard
+        global output_sink
+        global batch_answer
+        global batch_errors
+        state_buffer = (filesystem, command_history, object_clipboard, output_sink, batch_answer, batch_errors)
+        filesystem = self.find_cwd(session)
+        command_history = session.history
+        object_clipboard = session.clipboard
+        output_sink = JsonLinesSink(stream)
+        batch_answer = self.answer
+        batch_errors = []
+        try:
+            if not args:
+                print_error("command syntax is invalid.")
+            else:
+                dispatch_command(args)
+        except Exception as error:
+            print_error(f"{type(error).__name__}: {error}")
+        finally:
+            session.cwd = filesystem
+            session.history = command_history
+            session.clipboard = object_clipboard
+            # the tree may have been cleared, loaded or rolled back
+            self.root = get_root()
+            error_count = len(batch_errors)
+            filesystem, command_history, object_clipboard, output_sink, batch_answer, batch_errors = state_buffer
+        return error_count
+
+class FilesystemServer:
+    '''
+    Serves one shared filesystem to many clients over a TCP or Unix socket.
+    Each client is a session of the server's engine. It sends commands one per line, and
+    receives the output of each command as JSON lines ending with a done event.
+    '''
+    def __init__(self, answer = False, threads = 4) -> None:
+        self.engine = Engine(threads, answer)
+        self.session_count = 0
+
+    async def start(self, address):
+        '''
+        Starts listening on address, either host:port or unix:path, and returns the asyncio server.
+        '''
+        if address.startswith('unix:'):
+            return await asyncio.start_unix_server(self.serve_session, address[5:], limit = SERVER_LINE_LIMIT)
+        host, port = address.rsplit(':', 1)
+        return await asyncio.start_server(self.serve_session, host, int(port), limit = SERVER_LINE_LIMIT)
+
+    async def serve_session(self, reader, writer) -> None:
+        session = Session(self.engine.root)
+        self.session_count += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                args = tokenize_command(line.decode('utf-8', 'replace'))
+                if args and args['command'] == 'exit':
+                    break
+                # commands run on the engine's threads, so the event loop keeps serving other sessions
+                response = await asyncio.wrap_future(self.engine.submit(session, args))
+                writer.write(response.encode('utf-8'))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.session_count -= 1
+            writer.close()
 
 # UTILITY FUNCTIONS
 
-def load_filesystem(filename = 'default_filesystem.txt'):
+def emit(event_type, text, **fields) -> None:
+    '''
+    Passes an output event to output_sink. Events hold their type, the text that is printed
+    to the terminal, and any fields describing the objects involved.
     '''
-    Reads instructions from a text file and executes them to build filesystem.
+    fields['event'] = event_type
+    fields['text'] = text
+    output_sink.write(fields)
+
+def get_blob_store():
+    '''
+    Returns blob_store, creating it in blob_directory on first use.
+    '''
+    global blob_store
+    if blob_store is None:
+        blob_store = BlobStore(blob_directory)
+    return blob_store
+
+def set_output_sink(sink):
+    '''
+    Makes sink receive all output events, and returns the sink it replaces.
+    '''
+    global output_sink
+    sink_buffer = output_sink
+    output_sink = sink
+    return sink_buffer
+
+
+def global_context():
+    '''
+    Returns a CallContext for the working directory, history, clipboard and output held in the module globals.
+    '''
+    return CallContext(filesystem, output_sink, batch_answer, batch_line, batch_errors, command_history, object_clipboard)
+
+def call_globally(function, *args, **kwargs):
+    '''
+    Calls function with args and a CallContext for the module globals, then keeps the working directory,
+    history and clipboard it leaves in the context in the module globals.
+    '''
+    global filesystem
+    global command_history
+    global object_clipboard
+    context = global_context()
+    try:
+        function(*args, context = context, **kwargs)
+    finally:
+        filesystem = context.cwd
+        command_history = context.history
+        object_clipboard = context.clipboard
+
+def load_filesystem(filename = 'default_filesystem.txt', augment = ''):
+    '''
+    Reads a filesystem from a text file.
+    Snapshot files written by save_filesystem are rebuilt directly and replace the current filesystem.
+    With the lazy augment, only the root folder is read at once, and each other folder is read the first time
+    it is accessed, so loading takes the same time however large the file is.
+    Any other file is treated as a list of instructions, which are executed to build the filesystem.
     Unless instructed otherwise, loads file in local directory with name "default_filesystem.txt".
     '''
     # load_filesystem is called automatically when script is run as main
     global command_history
     global root_object
     global filesystem
+    global glob_patterns
 
     # initialise filesystem with root_object if filesystem is empty
     if not filesystem:
-        filesystem = copy.copy(root_object)
+        filesystem = Folder(root_object.name, '')
 
     # attempts to read from file with name filename
     try:
@@ -137,21 +1195,283 @@ def load_filesystem(filename = 'default_filesystem.txt'):
 
     # If this fails, performs no action
     except FileNotFoundError:
-        print('Err: default file not found.')
+        print_error('default file not found.')
 
     # if successful, executes instructions in file
     else:
-        print(f"Loading filesystem from {filename}...")
+        emit('message', f"Loading filesystem from {filename}...")
         with open(filename, 'r', encoding = 'utf-8') as file:
-            while True:
-                file_line = file.readline()
-                if file_line == 'end':
-                    break
-                file_line_san = command_sanitizer(file_line)
-                if file_line_san:
-                    command_parser(file_line_san)
-            print("Filesystem loaded.")
-                
+            # snapshot files are identified by their first line
+            header = file.readline().rstrip('\n')
+            if header in (SNAPSHOT_HEADER, SNAPSHOT_HEADER_DEPTH_FIRST):
+                if header == SNAPSHOT_HEADER and augment == 'lazy':
+                    root, filesystem = read_snapshot_lazily(filename)
+                else:
+                    root, filesystem = read_snapshot(file, header)
+                    rebuild_name_index(root)
+                resolve_cache.clear()
+                # the loaded file replaces all prior history
+                command_history = [f"load ~{filename}"]
+            else:
+                file.seek(0)
+                # files of commands may have been saved before glob patterns existed, when * ? and [
+                # were read as part of names, so their names are matched exactly
+                glob_patterns = False
+                try:
+                    # instructions end at an end line, or at the end of the file
+                    for file_line in file:
+                        if file_line.rstrip('\n') == 'end':
+                            break
+                        command_parser(file_line)
+                finally:
+                    glob_patterns = True
+            emit('message', "Filesystem loaded.")
+
+def write_snapshot(file, root, cwd):
+    '''
+    Writes the tree of objects below root to an open file, one record per object in breadth-first order.
+    Each record holds id, parent id, type, name and payload separated by tabs.
+    The payload is the content of a file, the id of the object a shortcut refers to as made by shortcut_payload,
+    or the id of the first object in a folder and the number of objects in it, as the objects of a folder
+    have consecutive ids.
+    The records are followed by a table of their offsets in the file, one fixed width line per record,
+    and a last line holding the offset of the table, so that any record can be read without reading the rest.
+    The file must be opened with newline = '', so that offsets count the bytes written.
+    '''
+    # first pass assigns ids, so that folders and shortcuts can refer to objects later in the order
+    ordered = [root]
+    ids = {root : 0}
+    # id of folder -> (id of first object, number of objects)
+    folder_ranges = {}
+    for obj_id, obj in enumerate(ordered):
+        if obj.type == 'folder':
+            branches = obj.get_branches()
+            folder_ranges[obj_id] = (len(ordered), len(branches))
+            for branch in branches:
+                ids[branch] = len(ordered)
+                ordered.append(branch)
+
+    header = f"{SNAPSHOT_HEADER}\n{ids.get(cwd, 0)}\n{len(ordered)}\n"
+    file.write(header)
+    offset = len(header)
+    offsets = []
+    # second pass writes records
+    for obj_id, obj in enumerate(ordered):
+        offsets.append(offset)
+        parent_id = ids[obj.context] if obj_id else -1
+        record = f"{obj_id}\t{parent_id}\t{obj.type}\t{snapshot_escape(obj.name)}\t"
+        if obj.type == 'file':
+            file.write(record)
+            offset += utf8_length(record)
+            # content is written a chunk at a time, so large content is never held in memory at once
+            for text in obj.buffer.iter_text():
+                text = snapshot_escape(text)
+                file.write(text)
+                offset += utf8_length(text)
+            record = ''
+        elif obj.type == 'shortcut':
+            record += shortcut_payload(obj.location, ids)
+        else:
+            record += '%d %d' % folder_ranges[obj_id]
+        record += '\n'
+        file.write(record)
+        offset += utf8_length(record)
+
+    table_offset = offset
+    file.write(''.join([f"{record_offset:016x}\n" for record_offset in offsets]))
+    file.write(f"{table_offset:016x}\n")
+
+def utf8_length(text) -> int:
+    return len(text) if text.isascii() else len(text.encode('utf-8'))
+
+def read_snapshot(file, header = None):
+    '''
+    Rebuilds a tree of objects from records written by write_snapshot in a single pass.
+    Expects the header line to have been read already, and to be passed if it is not SNAPSHOT_HEADER.
+    Returns the root object and the object that was the working directory when saved.
+    '''
+    cwd_id = int(file.readline())
+    if header == SNAPSHOT_HEADER_DEPTH_FIRST:
+        # records of depth-first save files, which have no offset table, continue to the end of the file
+        records = file
+    else:
+        records = itertools.islice(file, int(file.readline()))
+    objects = []
+    shortcuts = []
+    for line in records:
+        obj_id, parent_id, type, name, payload = line.rstrip('\n').split('\t')
+        name = snapshot_unescape(name)
+        # records always follow the record of their parent
+        context = objects[int(parent_id)] if parent_id != '-1' else ''
+        if type == 'file':
+            obj = File(name, context, snapshot_unescape(payload))
+        elif type == 'shortcut':
+            obj = Shortcut(name, context, None)
+            shortcuts.append((obj, payload))
+        else:
+            obj = Folder(name, context)
+        objects.append(obj)
+        if context:
+            context.add_branch(obj)
+
+    # shortcut locations may only be filled in once every object exists
+    for obj, payload in shortcuts:
+        # shortcuts without a valid location refer to their own context, as in populate
+        obj.location = read_shortcut_location(payload, objects.__getitem__) or obj.context
+
+    return objects[0], objects[cwd_id]
+
+def read_snapshot_lazily(filename):
+    '''
+    Reads the root object of a save file written by write_snapshot, and the objects within it.
+    Every other folder is read from the file the first time its objects are accessed.
+    Returns the root object and the object that was the working directory when saved.
+    '''
+    reader = SnapshotReader(filename)
+    with cache_lock:
+        root = reader.read_root()
+        rebuild_name_index(root)
+        # the root and the objects within it are read straight away, and added to name_index
+        root.get_branches()
+        return root, reader.find(reader.cwd_id)
+
+def snapshot_escape(text) -> str:
+    # tabs and newlines would otherwise split records and fields
+    return text.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+def snapshot_unescape(text) -> str:
+    if '\\' not in text:
+        return text
+    return SNAPSHOT_ESCAPE_RE.sub(lambda match: SNAPSHOT_ESCAPES.get(match.group(1), match.group(1)), text)
+
+def shortcut_payload(location, ids) -> str:
+    '''
+    Returns the payload of the record of a shortcut to location, given the ids of the objects being written.
+    A location outside those objects, such as a deleted folder, is written as the id of the nearest context of it
+    that is written, or -1, followed by the names leading from there to location, each preceded by a colon,
+    so that the shortcut is read back with the same address and finds whatever is later made there.
+    '''
+    names = []
+    while location and location not in ids:
+        names.append(':' + snapshot_escape(location.name))
+        location = location.context
+    return str(ids[location] if location else -1) + ''.join(reversed(names))
+
+def read_shortcut_location(payload, find):
+    '''
+    Returns the location of a shortcut from the payload of its record, using find to get an object from its id.
+    Returns None when the record refers to no object, as in files written before addresses were kept.
+    '''
+    location_id, *names = payload.split(':')
+    location_id = int(location_id)
+    if not names:
+        return find(location_id) if location_id >= 0 else None
+    # objects no longer in the tree are made again outside it, only to give the shortcut its address
+    location = find(location_id) if location_id >= 0 else ''
+    for name in names:
+        location = Folder(snapshot_unescape(name), location)
+    return location
+
+def open_journal(directory, group_size = 1, interval = 0.0, checkpoint_every = 10000):
+    '''
+    Opens a journal in directory, which records every later change to the filesystem.
+    If directory holds a checkpoint, the current filesystem is replaced by the one recovered from the latest
+    checkpoint and its journal. Otherwise the current filesystem is written as the first checkpoint.
+    '''
+    global journal
+    os.makedirs(directory, exist_ok = True)
+    generations = [int(match.group(1)) for match in map(JOURNAL_CHECKPOINT_RE.fullmatch, os.listdir(directory)) if match]
+    generation = max(generations, default = 0)
+    # files of earlier generations, and unfinished checkpoints, are left behind by a crash during a checkpoint
+    for name in os.listdir(directory):
+        match = JOURNAL_FILE_RE.fullmatch(name)
+        if match and (int(match.group(2)) != generation or match.group(4)):
+            os.remove(os.path.join(directory, name))
+    if generation:
+        recover_journal(directory, generation)
+    journal = Journal(directory, generation, group_size, interval, checkpoint_every)
+    if not generation:
+        journal.checkpoint(get_root(), filesystem)
+    return journal
+
+def recover_journal(directory, generation) -> None:
+    '''
+    Replaces the filesystem with the checkpoint of generation in directory, then replays the records of
+    its journal. A record left incomplete by a crash ends the journal, and is cut from the file.
+    '''
+    global filesystem
+    global command_history
+    global batch_answer
+    global batch_errors
+    with open(journal_path(directory, 'checkpoint', generation), 'r', encoding = 'utf-8') as file:
+        root, filesystem = read_snapshot(file, file.readline().rstrip('\n'))
+    rebuild_name_index(root)
+    resolve_cache.clear()
+    command_history = []
+
+    path = journal_path(directory, 'journal', generation)
+    record_count = 0
+    valid_end = 0
+    if os.path.exists(path):
+        # recorded commands are replayed without output, and without asking for confirmation
+        sink_buffer = set_output_sink(SilentSink())
+        state_buffer = (batch_answer, batch_errors)
+        batch_answer = True
+        batch_errors = []
+        try:
+            with open(path, 'rb') as file:
+                for line in file:
+                    record = read_journal_record(line)
+                    if record is None:
+                        break
+                    address, entries = record
+                    cwd = resolve(address, root)
+                    filesystem = cwd if cwd is not None and cwd.type == 'folder' else root
+                    for entry in entries:
+                        command_parser(entry)
+                    valid_end += len(line)
+                    record_count += 1
+        finally:
+            batch_answer, batch_errors = state_buffer
+            set_output_sink(sink_buffer)
+        if valid_end < os.path.getsize(path):
+            with open(path, 'r+b') as file:
+                file.truncate(valid_end)
+    emit('recovered', f"Filesystem recovered from checkpoint {generation} and {record_count} journal records.",
+         generation = generation, records = record_count)
+
+def read_journal_record(line):
+    '''
+    Returns the address and entries of a journal record, or None if the record is incomplete or damaged.
+    '''
+    if len(line) < 10 or not line.endswith(b'\n'):
+        return None
+    data = line[9:-1]
+    try:
+        if int(line[:8], 16) != zlib.crc32(data):
+            return None
+        return json.loads(data)
+    except ValueError:
+        return None
+
+def show_journal(augment = ''):
+    '''
+    Prints the state of the open journal. The !sync augment writes any records not yet synced to disk,
+    and the !checkpoint augment writes a checkpoint and begins a new journal.
+    '''
+    if journal is None:
+        print_error("no journal is open, one is opened by starting with --journal.")
+    elif augment == 'sync':
+        journal.sync()
+        emit('journal_synced', "Journal synced.")
+    elif augment == 'checkpoint':
+        journal.checkpoint(get_root(), filesystem)
+        emit('journal_checkpoint', f"Checkpoint {journal.generation} written.", generation = journal.generation)
+    else:
+        emit('journal', f"Journal {journal.generation} in {journal.directory}: {journal.records} records since checkpoint, "
+             f"{journal.pending} not yet synced.", directory = journal.directory, generation = journal.generation,
+             records = journal.records, pending = journal.pending)
+
 def clear_filesystem(augment = ''):
     '''
     Overwrites filesystem with fresh copy of root_object.
@@ -161,91 +1481,313 @@ def clear_filesystem(augment = ''):
     global filesystem
     # skip user validation if augment passed
     user_check = (augment == 'certain')
-    while not user_check:
-        user_command = input("Calling this function will copy the default root object to the filesystem. Anything not saved will be lost. Are you sure? (Y/N) > ")
-        if user_command.upper() == "Y":
-            user_check = True
-        print("No action has been performed.")
-        break
+    if not user_check:
+        user_check = confirm("Calling this function will copy the default root object to the filesystem. Anything not saved will be lost. Are you sure?")
+        if not user_check:
+            emit('message', "No action has been performed.")
     if user_check:
-        print("Command accepted. Filesystem has been overwritten.")
-        filesystem = copy.copy(root_object)
+        emit('message', "Command accepted. Filesystem has been overwritten.")
+        # fresh root, as a copy of root_object would share its branches
+        filesystem = Folder(root_object.name, '')
+        rebuild_name_index(filesystem)
+        resolve_cache.clear()
         aug_str = f"!{augment}" if augment else ''
         command_history.append(f"clear {aug_str}")
         
-def save_filesystem(filename = "q"):
+def take_snapshot(name_list, augment = ''):
     '''
-    Writes the contents of command_history to text file with name filename.
+    Stores a point-in-time snapshot of the filesystem under each name in name_list.
+    A snapshot is a lazy clone of the root, so taking one is O(1). Objects are only copied
+    along the paths changed after the snapshot was taken.
+    If no names are passed, lists stored snapshots. The !delete augment discards the named snapshots.
+    '''
+    if augment == 'delete':
+        for name in name_list:
+            if snapshots.pop(name, None) is None:
+                print_error(f"snapshot {name} not found.")
+            else:
+                emit('snapshot_deleted', f"Snapshot {name} deleted.", name = name)
+                command_history.append(f"snapshot ~{escape_arg(name)} !delete")
+        return
+
+    if not name_list:
+        s_plural = 's' * (len(snapshots) != 1)
+        colon = ':' * (len(snapshots) != 0) or '.'
+        lines = [f"{len(snapshots)} snapshot{s_plural} stored{colon}"]
+        lines.extend([f" > {name} at {address}" for name, (root, address) in snapshots.items()])
+        emit('listing', '\n'.join(lines), snapshots = [[name, address] for name, (root, address) in snapshots.items()])
+        return
+
+    root = get_root()
+    address = filesystem.get_address(True)
+    for name in name_list:
+        snapshots[name] = (clone_subtree(root, root.name, ''), address)
+        emit('snapshot_taken', f"Snapshot {name} taken at {address}.", name = name, address = address)
+        command_history.append(f"snapshot ~{escape_arg(name)}")
+
+def rollback_filesystem(name_list):
+    '''
+    Replaces the filesystem with the snapshot with the first name in name_list, and returns to the
+    working directory the snapshot was taken at. The filesystem becomes a lazy clone of the snapshot,
+    so rolling back is O(1) and the snapshot can be rolled back to again.
+    '''
+    global filesystem
+    if not name_list:
+        print_error("no snapshot name passed.")
+        return
+    name = name_list[0]
+    if name not in snapshots:
+        print_error(f"snapshot {name} not found.")
+        return
+
+    root, address = snapshots[name]
+    filesystem = clone_subtree(root, root.name, '')
+    rebuild_name_index(filesystem)
+    resolve_cache.clear()
+    # working directory falls back to the root if it cannot be found
+    filesystem = resolve(address) or filesystem
+    emit('rolled_back', f"Filesystem rolled back to snapshot {name}.", name = name, address = address)
+    command_history.append(f"rollback ~{escape_arg(name)}")
+
+def save_filesystem(filename = "q", augment = '', context = None):
+    '''
+    Writes a snapshot of the filesystem to text file with name filename.
     If the filename argument is "q" or is unassigned, then the file is named "qsave.txt".
+    If the history augment is passed, writes the commands needed to rebuild the filesystem instead,
+    which also replace the history of context.
+    Only reads the tree, so that sessions of an engine can save while others read.
     '''
-    
+    if context is None:
+        context = global_context()
     if filename == 'q':
         filename = "qsave.txt"
     else:
         # if user input is used, sanitise input
-        filename = filename_sanitizer(filename)
+        filename = filename_sanitizer(filename, context)
         # ask user if they want to overwrite existing file
-        if os.path.exists(filename):
-            print("File with the same name already exists. Overwrite? (Y/N) > ")
-            while user_command.upper() != "Y" or "N":
-                print("Invalid command.")
-                user_command = input("> ")
-            if user_command.upper() == "N":
-                print("Save command has been cancelled.")
+        if filename and os.path.exists(filename):
+            if not context.confirm("File with the same name already exists. Overwrite?"):
+                context.emit('message', "Save command has been cancelled.")
                 filename = ''
-            else:
-                print(f"Current filesystem has been saved as {filename}.")
     if filename:
-        # assemble file string with copy of global command history
-        cmd_hist_copy = command_history.copy()
-        cmd_hist_copy.append('end')
-        hist_to_write = '\n'.join(cmd_hist_copy)
-        with open(filename, 'w', encoding = 'utf-8') as file:
-            file.write(hist_to_write)
-        command_history.append(f"save ~{filename}")
+        root = get_root(context.cwd)
+        # the file is written in full before it replaces the old one, which folders may still be read from,
+        # and under a name of its own, as other sessions may save to the same file at once
+        temp_filename = f"{filename}.{threading.get_ident()}.tmp"
+        with open(temp_filename, 'w', encoding = 'utf-8', newline = '') as file:
+            if augment == 'history':
+                # history is reduced to the commands needed to rebuild the current filesystem
+                context.history = get_rebuild_script(root, context.cwd)
+                # entries are written one at a time, so only one file's content is held as text at once
+                for entry in context.history:
+                    file.write(str(entry))
+                    file.write('\n')
+                file.write('end')
+            else:
+                write_snapshot(file, root, context.cwd)
+        detach_readers(filename)
+        os.replace(temp_filename, filename)
+        if command_stats is not None:
+            command_stats.add('bytes_written', os.path.getsize(filename))
+        context.emit('saved', f"Current filesystem has been saved as {filename}.", filename = filename)
         
-def filename_sanitizer(name):
+def detach_readers(filename) -> None:
+    '''
+    Detaches every SnapshotReader of the file filename, so that folders still to be read from it are read
+    from its old content once it is replaced.
+    '''
+    if not os.path.exists(filename):
+        return
+    file_stat = os.stat(filename)
+    with cache_lock:
+        for reader in list(snapshot_readers):
+            if os.path.samestat(os.fstat(reader.file.fileno()), file_stat):
+                reader.detach()
+
+def filename_sanitizer(name, context = None):
     '''
-    Checks that input string only contains valid characters, is of valid length, and if the filename already exists.
+    Checks that input string only contains valid characters and is of valid length.
     Returns valid filename, or empty string if filename is invalid.
     '''
     
-    valid_non_alnum_chars = ["-","_"]
+    valid_non_alnum_chars = ["-","_","."]
     
     if len(name) <= 1:
-        print("Err: input filename is too short.")
+        (context or global_context()).error("input filename is too short.")
         return ""
-    if filename[-1:-5] != '.txt':
-        filename += '.txt'
     if not name.isalnum():
         # generate name string with all invalid characters removed
-        name = [char for char in name if char.isalnum() or char in valid_non_alnum_chars]
-    
+        name = ''.join([char for char in name if char.isalnum() or char in valid_non_alnum_chars])
+    if name[-4:] != '.txt':
+        name += '.txt'
+    return name
+
+def show_stats(augment = ''):
+    '''
+    Prints the statistics recorded for each command since statistics were enabled.
+    The !on and !off augments enable and disable recording, !reset discards what has been recorded,
+    and !json prints the statistics as JSON.
+    '''
+    global command_stats
+    if augment == 'on':
+        if command_stats is None:
+            command_stats = CommandStats()
+        emit('stats_enabled', "Command statistics enabled.")
+    elif augment == 'off':
+        command_stats = None
+        emit('stats_disabled', "Command statistics disabled.")
+    elif command_stats is None:
+        print_error("command statistics are disabled, enable them with stats !on.")
+    elif augment == 'reset':
+        command_stats = CommandStats()
+        emit('stats_reset', "Command statistics reset.")
+    elif augment == 'json':
+        stats = command_stats.as_dict()
+        emit('stats', json.dumps(stats, indent = 2), **stats)
+    else:
+        emit('stats', command_stats.report(), **command_stats.as_dict())
 
+def write_stats(filename) -> None:
+    '''
+    Writes the statistics recorded since statistics were enabled to filename as JSON.
+    '''
+    if command_stats is not None:
+        with open(filename, 'w', encoding = 'utf-8') as file:
+            json.dump(command_stats.as_dict(), file, indent = 2)
 
-def move_in(name_list, augment = ''):
+def compact_history(augment = ''):
+    '''
+    Replaces command_history with the shortest list of commands that rebuilds the current filesystem.
+    If the measure augment is passed, replays both the old and new history and prints the time taken by each.
+    '''
+    global command_history
+    compacted = get_rebuild_script(get_root(), filesystem)
+    if augment == 'measure':
+        old_time = replay_time(command_history)
+        new_time = replay_time(compacted)
+        emit('replay_time', f"Replay time before compaction: {old_time * 1000:.2f} ms.", stage = 'before', seconds = old_time)
+        emit('replay_time', f"Replay time after compaction: {new_time * 1000:.2f} ms.", stage = 'after', seconds = new_time)
+    emit('compacted', f"Command history compacted from {len(command_history)} to {len(compacted)} commands.",
+         before = len(command_history), after = len(compacted))
+    command_history = compacted
+
+def get_rebuild_script(root, cwd) -> list:
+    '''
+    Returns list of commands that rebuild the tree below root when executed from an empty root folder,
+    finishing with cwd as the working directory.
     '''
-    Takes one or more names as argument. For each name, changes current working directory to 
-    object in context whose name matches the passed name.
+    script = []
+    # shortcuts are created last, as their locations may not exist until the whole tree is built
+    shortcuts = []
+    # stack holds objects to visit, and None wherever the walk has to move out of a folder
+    stack = list(reversed(root.get_branches()))
+    while stack:
+        obj = stack.pop()
+        if obj is None:
+            script.append("out")
+            continue
+        name = escape_arg(obj.name)
+        if obj.type == 'file':
+            # content is read from the file's buffer only when the entry is written out or replayed
+            buffer = obj.buffer
+            script.append(ContentEntry(f"file ~{name}", [(buffer, 0, buffer.byte_size)]) if buffer.byte_size else f"file ~{name}")
+        elif obj.type == 'folder':
+            script.append(f"folder ~{name}")
+            branches = obj.get_branches()
+            if branches:
+                script.append(f"in @{name}")
+                stack.append(None)
+                stack.extend(reversed(branches))
+        elif obj.type == 'shortcut':
+            shortcuts.append(obj)
+
+    for obj in shortcuts:
+        context_address = obj.context.get_address(True)
+        address = obj.location.get_address(True)
+        # the shortcut command cannot make a shortcut to a missing location or to a file, so shortcuts
+        # left at one by a delete or rename refer to their own context, as in read_snapshot
+        location = resolve(address, root)
+        if location is None or location.type == 'file':
+            address = context_address
+        script.append(f"cd @{escape_arg(context_address)}")
+        script.append(f"shortcut ~{escape_arg(obj.name)} @{escape_arg(address)}")
+    if shortcuts or cwd is not root:
+        script.append(f"cd @{escape_arg(cwd.get_address(True))}")
+    return script
+
+def replay_time(history) -> float:
+    '''
+    Executes history against an empty root folder with output discarded, and returns the time taken in seconds.
+    The current filesystem is restored afterwards.
     '''
     global filesystem
     global command_history
+    global object_clipboard
+    global name_index
+    global pending_clones
+    global snapshots
+    global content_index
+    global content_files
+    state_buffer = (filesystem, command_history, object_clipboard, name_index, pending_clones, snapshots,
+                    content_index, content_files)
+    filesystem = Folder(root_object.name, '')
+    command_history = []
+    object_clipboard = []
+    name_index = {}
+    pending_clones = set()
+    snapshots = {}
+    content_index = None
+    content_files = set()
+
+    sink_buffer = set_output_sink(SilentSink())
+    start = time.perf_counter()
+    for line in history:
+        line = str(line)
+        # replaying a save would overwrite files on disk
+        if line.startswith('save'):
+            continue
+        command_parser(line)
+    elapsed = time.perf_counter() - start
+    set_output_sink(sink_buffer)
+
+    (filesystem, command_history, object_clipboard, name_index, pending_clones, snapshots,
+     content_index, content_files) = state_buffer
+    # cache may refer to objects in the replayed tree
+    resolve_cache.clear()
+    return elapsed
+
+def get_root(obj = None):
+    '''
+    Returns the root object of the tree containing obj, or the current working directory if no object is passed.
+    '''
+    if obj is None:
+        obj = filesystem
+    while obj.context:
+        obj = obj.context
+    return obj
+
+def move_in(name_list, augment = '', context = None):
+    '''
+    Takes one or more names as argument. For each name, changes the working directory of context to 
+    object in it whose name matches the passed name.
+    '''
+    if context is None:
+        context = global_context()
 
     for name in name_list:
-        # since each name should only occur once in each directory
-        # matches should have a length of 1
-        matches, _ = filesystem.get_name_matches(name_list)
-        if not matches:
-            print("Err: object not found.")
-            
-        obj = matches[0]
-        # if type is valid, write new value for filesystem
+        # each name only occurs once in each directory
+        obj = context.cwd.get_branch(name)
+        if obj is None:
+            context.error("object not found.")
+            break
+
+        # if type is valid, write new working directory
         if obj.type != 'file':
-            filesystem = obj
+            context.cwd = obj
             if augment != 'norec':
-                command_history.append(f"in @{name}")
+                context.history.append(f"in @{escape_arg(name)}")
         else:
-            print("Err: file object cannot be made a working directory.")
+            context.error("file object cannot be made a working directory.")
         '''
         # iterate through objects stored in current context
         for i, obj in enumerate(filesystem.get_branches()):
@@ -258,59 +1800,97 @@ def move_in(name_list, augment = ''):
         else:
             print("Err: object not found.")
         '''
-def move_out(augment = ''):
-    global filesystem
-    global command_history
+def move_out(augment = '', context = None):
+    if context is None:
+        context = global_context()
     # If current object has context, get context
     # make the current object's context the current object
-    if not filesystem.context:
-        print("Err: no valid context found.")
+    if not context.cwd.context:
+        context.error("no valid context found.")
     else:
-        filesystem = filesystem.context
+        context.cwd = context.cwd.context
         if augment != 'norec':
-            command_history.append(f"out")
+            context.history.append(f"out")
 
-def change_directory(target_address_list_raw, augment = ''):
+def change_directory(target_address_list_raw, augment = '', context = None):
     '''
-    Takes one or more addresses as argument. For each address, changes current working directory to 
+    Takes one or more addresses as argument. For each address, changes the working directory of context to 
     object whose address matches passed address.
     '''
-    global command_history
-    global filesystem
+    if context is None:
+        context = global_context()
     for target_address_raw in target_address_list_raw:
-        # convert target_address to list to get iterator of object names
-        target_address = target_address_raw.split(':')
-        curr_address = filesystem.get_address()
-        # does the maximum term of target address exist within current address?
-        target_add_max = target_address[0]
-        target_max_loc = curr_address.count(target_add_max)
-        
-        # if yes, then iteratively move out of context until current object = maximum term
-        if target_max_loc:       
-            steps_to_target_max = len(curr_address) - target_max_loc
-            for i in range(steps_to_target_max):
-                move_out(augment = 'norec')
-            # then follow target address in until arriving at the final term and the target object
-            target_address = target_address[1:]
-            move_in(target_address)
-            
-        # otherwise, take the length of the target address as L
+        obj = resolve(target_address_raw, context.cwd)
+        if obj is None:
+            context.error("unable to find target directory.")
+        elif obj.type == 'file':
+            context.error("file object cannot be made a working directory.")
         else:
-            target_add_len = len(target_address)
-            # move out of context (L - 1) times
-            for i in range(1, target_add_len):
-                move_out(augment = 'norec')
-            # check if maximum term of target list exists within current context
-            branch_names = [obj.name for obj in filesystem.get_branches()]
-            # if yes, then follow target address down until final term and target object
-            if target_add_max in branch_names:
-                move_in(target_address, augment = 'norec')
-                if augment != 'norec':
-                    command_history.append(f"cd @{target_address_raw}")
-            # if not, then print error message
-            else:
-                change_directory([':'.join(curr_address)])
-                print("Err: unable to find target directory.")
+            context.cwd = obj
+            if augment != 'norec':
+                context.history.append(f"cd @{escape_arg(target_address_raw)}")
+
+def resolve(address, start = None):
+    '''
+    Returns reference to object at address, or None if there is no such object.
+    The address may begin at the root object, at any object containing start, or at an object within start.
+    Does not change the current working directory. Start defaults to the current working directory.
+    '''
+    if start is None:
+        start = filesystem
+    names = address.split(':')
+    first_name = names[0]
+
+    # find the object the address begins at
+    # the root object is found as the last object containing start
+    anchors = []
+    curr_context = start
+    while curr_context:
+        if curr_context.name == first_name:
+            anchors.append(curr_context)
+        root = curr_context
+        curr_context = curr_context.context
+    # addresses from the root take precedence over ones from other containing objects
+    anchors.reverse()
+    if start.type == 'folder':
+        anchor = start.get_branch(first_name)
+        if anchor:
+            anchors.append(anchor)
+
+    for anchor in anchors:
+        # cache is keyed by complete address from the root
+        if anchor is root:
+            key = (root, address)
+        else:
+            key = (root, ':'.join([anchor.get_address(True)] + names[1:]))
+        with cache_lock:
+            obj = resolve_cache.get(key)
+            if obj is not None:
+                resolve_cache.move_to_end(key)
+                if command_stats is not None:
+                    # only the contexts of start were visited
+                    command_stats.add('nodes_visited', start.get_depth() + 1)
+                return obj
+
+        obj = anchor
+        for name in names[1:]:
+            if obj.type != 'folder':
+                break
+            obj = obj.get_branch(name)
+            if obj is None:
+                break
+        else:
+            with cache_lock:
+                resolve_cache[key] = obj
+                # least recently used addresses are dropped once the cache is full
+                if len(resolve_cache) > RESOLVE_CACHE_SIZE:
+                    resolve_cache.popitem(last = False)
+            if command_stats is not None:
+                command_stats.add('nodes_visited', start.get_depth() + len(names))
+            return obj
+    if command_stats is not None:
+        command_stats.add('nodes_visited', start.get_depth() + 1)
+    return None
 
 def create_file(name_list, content_list = []):
     '''
@@ -323,17 +1903,18 @@ def create_file(name_list, content_list = []):
     for i in range(len_diff):
         content_list.append('')
 
-    branch_names = [obj.name for obj in filesystem.get_branches()]
     for i, name in enumerate(name_list):
         # get content associated with name
         content = content_list[i]
 
         # mutate name if object in context already possesses name
-        while name in branch_names:
-            name += '_o'
+        name = filesystem.free_name(name, '_o')
 
         filesystem.populate(name, 'file', content)
-        command_history.append(f"file ~{name} #{content}")
+        buffer = filesystem.get_branch(name).buffer
+        if command_stats is not None:
+            command_stats.add('bytes_written', buffer.byte_size)
+        command_history.append(ContentEntry(f"file ~{escape_arg(name)}", [(buffer, 0, buffer.byte_size)]))
             
 def create_folder(name_list):
     '''
@@ -342,16 +1923,12 @@ def create_folder(name_list):
     global filesystem
     global command_history
     
-    # produce list of objects in current context
-    branch_names = [obj.name for obj in filesystem.get_branches()]
-    
     for name in name_list:
         # mutate name if object in context already possesses name
-        while name in branch_names:
-            name += '_o'
+        name = filesystem.free_name(name, '_o')
 
         filesystem.populate(name, 'folder')
-        command_history.append(f"folder ~{name}")
+        command_history.append(f"folder ~{escape_arg(name)}")
 
 def create_shortcut(name_list, address_list):
     '''
@@ -366,37 +1943,20 @@ def create_shortcut(name_list, address_list):
     if len_name > len_add:
         name_list = name_list[0:len_add]
 
-    # produce list of objects in current context
-    branch_names = [obj.name for obj in filesystem.get_branches()]
     for i, name in enumerate(name_list):
         address = address_list[i]
         # get reference to object with address argument
-        address_obj = validate_address(address)
+        address_obj = resolve(address)
         # skip shortcut creation if address argument is not valid
-        if not address_obj:
+        if not address_obj or address_obj.type == 'file':
+            print_error(f"location {address} not found.")
             continue
         # mutate name if object in context already possesses name
-        while name in branch_names:
-            name += '_s'
+        name = filesystem.free_name(name, '_s')
 
         filesystem.populate(name, 'shortcut', location = address_obj)
-        command_history.append(f"shortcut ~{name} @{address}")
+        command_history.append(f"shortcut ~{escape_arg(name)} @{escape_arg(address)}")
     
-def validate_address(address):
-    global filesystem
-    # record current address
-    home_address = filesystem.get_address(True)
-    # navigate to address
-    change_directory([address], 'norec')
-    target_address = filesystem.get_address(True)
-    # if target_address = address argument, then the argument is valid
-    if target_address == address:
-        # return reference to object at target address
-        address_obj = filesystem
-        change_directory([home_address], 'norec')
-        return address_obj
-    return None
-
 def shortcut_entry_check():
     global filesystem
     # if current directory is a shortcut, change directory to shortcut stored address
@@ -404,9 +1964,94 @@ def shortcut_entry_check():
     name = filesystem.name
     if type == 'shortcut':
         # access shortcut address
-        address = filesystem.branches[0].get_address(True)
-        change_directory([address])
-        print(f"Taken shortcut {name} to address {address}.")
+        address = filesystem.location.get_address(True)
+        target = shortcut_target(filesystem)
+        if target is None:
+            # shortcut location no longer exists, so return to the shortcut's context
+            filesystem = filesystem.context
+            print_error(f"location {address} of shortcut {name} not found.")
+        else:
+            filesystem = target
+            emit('shortcut_taken', f"Taken shortcut {name} to address {address}.", name = name, address = address)
+
+def shortcut_target(shortcut):
+    '''
+    Returns the object at the address of shortcut's location, or None if there is no such object or it is a file.
+    Targets are cached until an object is renamed or deleted. Missing targets are looked up each time,
+    as an object may since have been created at the address.
+    '''
+    cache = shortcut.target_cache
+    if cache is not None and cache[0] == shortcut_generation and cache[1] is shortcut.location:
+        return cache[2]
+    location = shortcut.location
+    target = resolve(location.get_address(True), shortcut)
+    if target is None or target.type == 'file':
+        return None
+    shortcut.target_cache = (shortcut_generation, location, target)
+    return target
+
+def confirm(prompt) -> bool:
+    '''
+    Asks the user to answer prompt with Y or N, and returns True if the answer is Y.
+    In batch mode, returns batch_answer without asking.
+    '''
+    if batch_answer is not None:
+        return batch_answer
+    user_command = input(f"{prompt} (Y/N) > ")
+    return user_command.upper() == "Y"
+
+def print_error(message) -> None:
+    '''
+    Prints error message to terminal. In batch mode, also records message with the current line number.
+    '''
+    emit('error', f"Err: {message}", message = message)
+    if batch_answer is not None:
+        batch_errors.append((batch_line, message))
+
+def run_batch(file) -> bool:
+    '''
+    Executes each line of an open file as a command, without asking the user for any input.
+    Confirmations are answered with batch_answer. Stops at an exit command or at the end of the file.
+    Prints a summary of errors to stderr, and returns True if no errors occurred.
+    '''
+    global batch_line
+    command_count = 0
+    start = time.perf_counter()
+    for batch_line, line in enumerate(file, 1):
+        args = tokenize_command(line)
+        if not args:
+            if line.strip():
+                print_error("command syntax is invalid.")
+            continue
+        if args['command'] == 'exit':
+            break
+        command_count += 1
+        # errors raised by a command are recorded, then the next command is executed
+        try:
+            dispatch_command(args)
+        except Exception as error:
+            print_error(f"{type(error).__name__}: {error}")
+    elapsed = time.perf_counter() - start
+
+    for line_number, message in batch_errors:
+        print(f"line {line_number}: Err: {message}", file = sys.stderr)
+    rate = command_count / elapsed if elapsed else 0
+    print(f"Batch complete: {command_count} commands, {len(batch_errors)} errors, {elapsed:.3f} s ({rate:,.0f} commands/s).", file = sys.stderr)
+    return not batch_errors
+
+def run_server(address, answer = False, threads = 4) -> None:
+    '''
+    Serves the filesystem on address until interrupted.
+    '''
+    async def main():
+        server = await FilesystemServer(answer, threads).start(address)
+        print(f"Serving filesystem on {address}.", file = sys.stderr)
+        async with server:
+            await server.serve_forever()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("Server stopped.", file = sys.stderr)
 
 def exit():
     # returns True if exit successful, otherwise returns False
@@ -417,71 +2062,100 @@ def exit():
             return True
         elif user_command.upper() == "Y":
             user_command = input("Enter name for filesystem to be saved under, or enter 'q' for a quicksave. > ")
-            save_filesystem(user_command)
+            call_globally(save_filesystem, user_command)
             return True
 
-def command_sanitizer(command):
-    # takes a string entered by the user
-    # weak: augments the entered string such that it meets the program requirements
-    # strong: rejects any invalid entered strings, otherwise returns entered string
-    command_reject = '' # truth value of 0
+def tokenize_command(user_command):
+    '''
+    Splits a user string into command, name, location, augment and content arguments in a single scan.
+    Returns hash of arguments, or None if the string is empty or passes the same tag more than once.
+    Tag characters, | and % are read as text when preceded by the escape character %. Other characters
+    following % are read as they are, with the %.
+    Everything after the content tag belongs to the content argument.
+    '''
+    user_command = strip_escaped(user_command)
+    if not user_command:
+        return None
 
-    # valid string:
-    # must have > 0 length -> S
-    if len(command) < 1:
-        return command_reject
-    
-    # maximum of 1 of each tag character, unless preceded by escape character
-    tag_list = re.findall("[^%][~@#!]", command)
-    if tag_list:
-        # remove non-tag characters
-        tag_list = [tag[1] for tag in tag_list]
-        tag_set = set(())
-        # sets in python cannot contain duplicate values
-        [tag_set.add(tag) for tag in tag_list]
-        if len(tag_list) != len(tag_set):
-            return command_reject
-    
-    # no whitespaces at beginning or end -> W
-    command = command.strip()
-    
-    # must only contain alnums, valid special characters and valid tag characters -> W
-    # this rule may be broken if the preceding character is the escape character %
-    # command = re.sub(f"[^%][^-_%@#!:|~ \w]", "", command)
-    
-    # only alnums and valid special characters can adjacent-repeat - no tags or whitespaces -> W
-    # identify any occurence of two or more adjacent invalid characters
-    # in each occurence, remove all characters except the first
-    adj_exceptions = re.findall(f".[:@#~!|][:@#~!| ]+", command)
-    for excp in adj_exceptions:
-        # only perform removal if no escape character present
-        if excp[0] != '%':
-            command = re.sub(f"{excp}", f"{excp[1]}", command)
-
-    # tags must occur after a whitespace or escape character -> W
-    # identify occurences of non-whitespace before tag
-    # replace occurence with original tag
-    adj_exceptions = re.findall(f"[^ %][@#~!]", command)
-    for excp in adj_exceptions:
-        excp_corrected = excp[0] + ' ' + excp[1:]
-        command = re.sub(f"{excp}", f"{excp_corrected}", command)
-
-    return command
-
-def extract_arg(tag, command) -> list:
-    # find string enclosed by tag and whitespace/semicolon
-    # does not include tags preceded by escape characters
-    temp = re.findall(f"[^%]{tag}[^~@!#]+[ ;]", command)
-    # only proceed if temp is not empty and argument has been found
-    if not temp:
-        return []
-    temp = temp[0]
-    l = len(temp) - 1
-    # remove enclosing chars
-    temp = temp[2:l]
-    # plurality - get argument list
-    out = temp.split('|')
-    return out
+    # command argument has no tag, so it ends at the first whitespace or tag
+    command_end = COMMAND_RE.match(user_command).end()
+    args = {
+        'command' : user_command[:command_end],
+        'name' : [],
+        'location' : [],
+        'augment' : '',
+        'recursive' : False,
+        'follow' : False,
+        'content' : [],
+        'untagged' : False
+    }
+    # tag of the argument being read, and the text pieces it has been split into by |
+    tag = ''
+    pieces = []
+    tags_seen = set()
+    start = command_end
+    # only tags, | and escaped characters are visited, the text between them is sliced
+    for match in TOKEN_RE.finditer(user_command, command_end):
+        char = match.group()
+        # escaped characters and tags within the content argument are read as text
+        if len(char) == 2 or (tag == '#' and char != '|'):
+            continue
+        pieces.append(user_command[start:match.start()])
+        start = match.end()
+        if char != '|':
+            # sanitation: each tag can only be passed once
+            if char in tags_seen:
+                return None
+            tags_seen.add(char)
+            store_arg(args, tag, pieces)
+            tag = char
+            pieces = []
+    pieces.append(user_command[start:])
+    store_arg(args, tag, pieces)
+    return args
+
+def store_arg(args, tag, pieces) -> None:
+    # text before the first tag is an argument that has not been prefixed with a tag
+    if not tag:
+        args['untagged'] = any(piece.strip() for piece in pieces)
+        return
+    items = [strip_escaped(piece) for piece in pieces]
+    items = [ESCAPE_RE.sub(unescape_char, item) if '%' in item else item for item in items]
+    if tag == '#':
+        args['content'] = items
+    elif tag == '!':
+        # only 1 augment can be passed in each command, though recursive and follow can be passed alongside it
+        augments = [item for item in items if item]
+        args['recursive'] = 'recursive' in augments
+        args['follow'] = 'follow' in augments
+        augments = [augment for augment in augments if augment not in ('recursive', 'follow')]
+        args['augment'] = augments[0] if augments else ''
+    else:
+        args[TAG_ARGS[tag]] = [item for item in items if item]
+
+def escape_arg(text) -> str:
+    # prefix tag characters, | and % with the escape character so that text reads back as one argument
+    # line breaks are written as %n and %r, so that an escaped argument stays on one line
+    text = ARG_ESCAPE_RE.sub(lambda match: ARG_ESCAPES.get(match.group(), '%' + match.group()), text)
+    # whitespace at either end would be stripped from the argument unless escaped
+    if text and (text[0].isspace() or text[-1].isspace()):
+        text = EDGE_SPACE_RE.sub(lambda match: ''.join(['%' + char for char in match.group()]), text)
+    return text
+
+def strip_escaped(text) -> str:
+    # strips whitespace from both ends of text, apart from whitespace escaped by the character before it
+    stripped = text.strip()
+    if stripped.endswith('%') and (len(stripped) - len(stripped.rstrip('%'))) % 2:
+        start = len(text) - len(text.lstrip())
+        stripped = text[start:start + len(stripped) + 1]
+    return stripped
+
+def unescape_char(match) -> str:
+    char = match.group(1)
+    if char is None:
+        # run of escaped whitespace at either end of the argument
+        return match.group()[1::2]
+    return ARG_UNESCAPES.get(char, char)
 
 def command_parser(user_command):
     '''
@@ -489,108 +2163,322 @@ def command_parser(user_command):
     call and pass arguments to one of a set of utility functions. If no matching utility
     function is found, then no action takes place.
     '''
-    
+    args = tokenize_command(user_command)
     # Early escape if string is invalid
-    if user_command == '':
+    if not args:
         return None
-    
-    # splits user_command into 1-5 strings and/or lists, which are used to define arguments
-    # to support argument plurality, each argument (except command and augment) is a list with a default length of 1
-    # initialise args with empty strings/lists
-    args = {
-        'name' : [],
-        'location' : [],
-        'augment' : '',
-        'content' : []
-    }
-    # command argument has no tag so it gets identified early
-    command_pair = user_command.split(" ", 1)
-    args['command'] = command_pair.pop(0)
-
-    # get user_command as string and its argument tags as a list
-    if command_pair:
-        user_command = command_pair[0]
-        # bracket user_command with whitespace and semicolon to indicate argument limits
-        user_command = ' ' + user_command + ';'
-        user_command_tags = re.findall("[~@!#]", user_command)
-        
-        args['name'] = extract_arg('~', user_command)
-        args['location'] = extract_arg('@', user_command)
-        # only 1 augment tag can be passed in each command
-        temp = extract_arg('!', user_command)
-        args['augment'] = temp[0] if temp else ''
-        args['content'] = extract_arg('#', user_command)
-    
-        # get user_command without content argument but with content tag
-        # " ~a @b !c #"
-        if user_command.count('#'):
-            user_command = user_command.split('#')[0]
-            user_command += '#'
-        # in this range, number of spaces = number of arguments is the correct equivalence
-        spaces_count = user_command.count(' ')
-        tags_count = len(user_command_tags)
-        # sanitation eliminates the possibility of tag duplicates: so a non-zero equivalence indicates arguments have not been tagged.
-        if tags_count - spaces_count != 0:
-            print("Err: argument in input has not been prefixed with a tag.")
-    
-    function_hash = {
-        'in' : lambda args: move_in(args['location']),
-        'out' : lambda args: move_out(),
-        'cd' : lambda args: change_directory(args['location']),
-
-        'file' : lambda args: create_file(args['name'], args['content']),
-        'folder' : lambda args: create_folder(args['name']),
-        'shortcut' : lambda args: create_shortcut(args['name'], args['location']),
-        'delete' : lambda args: delete_objects(args['name'], args['augment']),
-
-        'read' : lambda args: read_files(args['name']),
-        'write' : lambda args: write_files(args['name'], args['augment'], args['content']),
-        'rename' : lambda args: rename_objects(args['name'], args['content']),
-        'copy' : lambda args: copy_objects(args['name']),
-        'paste' : lambda : paste_objects(),
-
-        'list' : lambda args: list_context(),
-        'props' : lambda args: object_properties(args['name']),
-        'search' : lambda args: search_filesystem_wrapper(args['name']),
-
-        'save' : lambda args: save_filesystem(args['name']),
-        'load' : lambda args: load_filesystem(args['name']),
-        'help' : lambda args: help(args['location'])
-    }
+    dispatch_command(args)
 
-    func_hash_keys = [key for key in function_hash.keys()]
-    # check if command argument is contained in key list
-    if args['command'] in func_hash_keys:
-        # access lambda function associated with key
+def dispatch_command(args):
+    '''
+    Calls the utility function associated with the command argument in function_hash.
+    While a journal is open, the history entries of commands that can change the tree are appended to
+    the journal. Moving between folders and copying change nothing, as each record holds the address
+    it is replayed from and journal_paste copies the clipboard again.
+    '''
+    command = args['command']
+    if journal is None or journal.depth or command in READ_COMMANDS or command in parallel_function_hash:
+        call_command(args)
+    else:
+        journal_command(args)
+
+def journal_command(args):
+    '''
+    Calls the command in args, then appends the history entries it added to journal, with the address
+    they are to be replayed from. Commands that replace the root, or import host files, are written as
+    a checkpoint instead, as their entries refer to files or snapshots that recovery may not find.
+    '''
+    root = get_root()
+    address = filesystem.get_address(True)
+    history = command_history
+    length = len(history)
+    clipboard = object_clipboard
+    journal.depth += 1
+    try:
+        call_command(args)
+    finally:
+        journal.depth -= 1
+        new_root = get_root()
+        entries = [str(entry) for entry in history[length:]] if command_history is history else []
+        # the clipboard may have been filled before the last checkpoint, or by another session
+        entries = journal_paste(entries, clipboard, root, address)
+        if new_root is not root or entries is None or any(entry.startswith('import ') for entry in entries):
+            journal.checkpoint(new_root, filesystem)
+        # commands that replace the history, such as save and compact, do not change the filesystem
+        elif entries:
+            journal.append(address, entries)
+            if journal.records >= journal.checkpoint_every:
+                journal.checkpoint(root, filesystem)
+
+def journal_paste(entries, clipboard, root, address):
+    '''
+    Returns entries, where a paste uses clipboard as it was before entries, preceded by commands that copy
+    the objects in clipboard again from where they are now. The paste can then be replayed without the copy
+    that filled clipboard. Returns None if that is not possible, when objects have been deleted since they
+    were copied or entries hold more than the paste.
+    '''
+    for entry in entries:
+        if entry.startswith('copy '):
+            return entries
+        if entry == 'paste':
+            break
+    else:
+        return entries
+    if entries != ['paste'] or not clipboard:
+        return None
+    context = clipboard[0].context
+    if any(obj.context is not context or not is_held_by(obj, root) for obj in clipboard):
+        return None
+    names = '|'.join([escape_arg(obj.name) for obj in clipboard])
+    return [f"cd @{escape_arg(context.get_address(True))}", f"copy ~{names}", f"cd @{escape_arg(address)}", 'paste']
+
+def call_command(args):
+    if args['untagged']:
+        print_error("argument in input has not been prefixed with a tag.")
+    # access lambda function associated with command argument
+    function = function_hash.get(args['command'])
+    if function:
         # pass hash of arguments as argument to lambda function
-        function_hash[args['command']](args)
+        if command_stats is None:
+            function(args)
+        else:
+            command_stats.run(args['command'], function, args)
         # check for entry into a shortcut
         if args['command'] in ['in', 'cd']:
             shortcut_entry_check()
     else:
-        print("Err: command argument not recognised.")
-
-def read_files(name_list):
+        print_error("command argument not recognised.")
+
+# command argument -> utility function, called with hash of arguments
+function_hash = {
+    'in' : lambda args: call_globally(move_in, args['location']),
+    'out' : lambda args: call_globally(move_out),
+    'cd' : lambda args: call_globally(change_directory, args['location']),
+
+    'file' : lambda args: create_file(args['name'], args['content']),
+    'folder' : lambda args: create_folder(args['name']),
+    'shortcut' : lambda args: create_shortcut(args['name'], args['location']),
+    'delete' : lambda args: delete_objects(args['name'], args['augment'], args['recursive']),
+
+    'read' : lambda args: read_files(args['name'], args['content'], global_context(), args['recursive'], args['follow']),
+    'write' : lambda args: write_files(args['name'], args['augment'], args['content'], args['recursive']),
+    'rename' : lambda args: rename_objects(args['name'], args['content'], args['recursive']),
+    'copy' : lambda args: call_globally(copy_objects, args['name'], args['recursive']),
+    'paste' : lambda args: paste_objects(),
+    'import' : lambda args: import_objects(args['name'], args['content']),
+    'export' : lambda args: call_globally(export_objects, args['name'], args['content']),
+
+    'list' : lambda args: list_context(global_context()),
+    'props' : lambda args: object_properties(args['name'], global_context()),
+    'search' : lambda args: search_filesystem_wrapper(args['name'], args['augment'], global_context(), args['follow']),
+    'grep' : lambda args: grep_files(args['content'], global_context()),
+    'compact' : lambda args: compact_history(args['augment']),
+    'stats' : lambda args: show_stats(args['augment']),
+    'journal' : lambda args: show_journal(args['augment']),
+    'clear' : lambda args: clear_filesystem(args['augment']),
+    'snapshot' : lambda args: take_snapshot(args['name'], args['augment']),
+    'rollback' : lambda args: rollback_filesystem(args['name'][:1]),
+
+    'save' : lambda args: call_globally(save_filesystem, *args['name'][:1], augment = args['augment']),
+    'load' : lambda args: load_filesystem(*args['name'][:1], augment = args['augment']),
+    'help' : lambda args: help(args['location'])
+}
+
+# commands that only read the tree, called with an explicit CallContext so that they can run in parallel
+parallel_function_hash = {
+    'in' : lambda args, context: move_in(args['location'], context = context),
+    'out' : lambda args, context: move_out(context = context),
+    'cd' : lambda args, context: change_directory(args['location'], context = context),
+    'copy' : lambda args, context: copy_objects(args['name'], args['recursive'], context),
+    'save' : lambda args, context: save_filesystem(*args['name'][:1], augment = args['augment'], context = context),
+    'export' : lambda args, context: export_objects(args['name'], args['content'], context),
+    'read' : lambda args, context: read_files(args['name'], args['content'], context, args['recursive'], args['follow']),
+    'list' : lambda args, context: list_context(context),
+    'props' : lambda args, context: object_properties(args['name'], context),
+    'search' : lambda args, context: search_filesystem_wrapper(args['name'], args['augment'], context, args['follow']),
+    'grep' : lambda args, context: grep_files(args['content'], context),
+}
+
+def match_objects(folder, name_list, recursive = False, descend = True, follow = False):
+    '''
+    Returns (object, name) for each object in folder, or below folder if recursive, whose name is in
+    name_list or matches a glob pattern in name_list, with the name or pattern it matched, and the names
+    and patterns that matched no object. Patterns are compiled once and tested in a single pass over
+    the objects of folder, or of its subtree as walked by walk_objects. Objects within a matched folder
+    are skipped unless descend, and the targets of shortcuts are walked as well if follow.
+    A wildcard preceded by % matches itself, and no name is a pattern while glob_patterns is off.
+    '''
+    patterns = [(name, compile_glob(name)) for name in dict.fromkeys(name_list) if is_glob(name)]
+    # exact name each name that is not a pattern matches -> that name
+    exact_names = {literal_name(name) : name for name in name_list if not is_glob(name)}
+    if not patterns and not recursive:
+        # exact names are looked up in branch_index without a pass over the folder
+        match_list, absent_names = folder.get_name_matches(exact_names)
+        return [(obj, exact_names[obj.name]) for obj in match_list], [exact_names[name] for name in absent_names]
+
+    matches = []
+    matched_names = set()
+    visited = 0
+    # matched folders are added to prune as they are walked, so that the walk does not enter them
+    prune = set()
+    for obj in walk_objects(folder, follow, prune) if recursive else folder.get_branches():
+        visited += 1
+        name = exact_names.get(obj.name)
+        if name is None:
+            for pattern_name, pattern in patterns:
+                if pattern.fullmatch(obj.name):
+                    name = pattern_name
+                    break
+        if name is not None:
+            matches.append((obj, name))
+            matched_names.add(name)
+            if not descend:
+                prune.add(obj)
+    if command_stats is not None:
+        command_stats.add('nodes_visited', visited)
+    return matches, [name for name in name_list if name not in matched_names]
+
+def walk_objects(folder, follow = False, prune = ()):
+    '''
+    Yields every object below folder, each folder followed by the objects within it, in address order.
+    Folders in prune when they are yielded are not entered. If follow, the folder a shortcut leads to
+    is entered after the shortcut is yielded, unless it has already been walked, so that shortcuts
+    leading back up the tree or to each other cannot make the walk repeat itself.
+    '''
+    visited = {folder}
+    stack = [iter(folder.get_branches())]
+    while stack:
+        obj = next(stack[-1], None)
+        if obj is None:
+            stack.pop()
+            continue
+        yield obj
+        if obj.type == 'folder':
+            if obj not in prune and obj not in visited:
+                visited.add(obj)
+                stack.append(iter(obj.get_branches()))
+        elif obj.type == 'shortcut' and follow:
+            # a shortcut may lead to another shortcut, whose target is then taken in turn
+            target = obj
+            while target is not None and target.type == 'shortcut' and target not in visited:
+                visited.add(target)
+                target = shortcut_target(target)
+            if target is not None and target.type == 'folder' and target not in visited:
+                visited.add(target)
+                stack.append(iter(target.get_branches()))
+
+def is_glob(name) -> bool:
+    return glob_patterns and GLOB_CHARS_RE.search(name) is not None
+
+def literal_name(name) -> str:
+    # the name a name that is not a pattern matches, without the % before wildcards
+    return GLOB_ESCAPE_RE.sub(r'\1', name) if glob_patterns and '%' in name else name
+
+def compile_glob(pattern):
+    '''
+    Compiles a glob pattern, where * matches any text, ? any one character and [...] any character
+    listed, or any not listed if it begins with !. Each of them is captured as a group.
+    %*, %? and %[ match the character after the %.
+    '''
+    pieces = []
+    start = 0
+    for match in GLOB_TOKEN_RE.finditer(pattern):
+        pieces.append(re.escape(pattern[start:match.start()]))
+        token = match.group()
+        if token[0] == '%':
+            pieces.append(re.escape(token[1]))
+        elif token == '*':
+            pieces.append('(.*)')
+        elif token == '?':
+            pieces.append('(.)')
+        else:
+            negate = token.startswith('[!')
+            # members are read as text, apart from the - of ranges
+            members = re.escape(token[2 if negate else 1:-1]).replace('\\-', '-')
+            pieces.append(f"([{'^' if negate else ''}{members}])" if members else re.escape(token))
+        start = match.end()
+    pieces.append(re.escape(pattern[start:]))
+    return re.compile(''.join(pieces), re.DOTALL)
+
+def glob_substitute(pattern, name, new_name) -> str:
+    # each * in new_name is replaced by the text matched by the next wildcard of pattern in name,
+    # and each %* by *
+    if not is_glob(pattern) or '*' not in new_name:
+        return new_name
+    groups = iter(compile_glob(pattern).fullmatch(name).groups())
+    return GLOB_STAR_RE.sub(lambda star: '*' if len(star.group()) == 2 else next(groups, ''), new_name)
+
+def bulk_record(command, names, augment = '', recursive = False, contents = None) -> str:
+    '''
+    Returns the single history entry of a command applied to the objects matching names.
+    contents holds the content argument as ContentEntry pieces, if the command has one.
+    '''
+    augments = [augment] if augment else []
+    if recursive:
+        augments.append('recursive')
+    if not glob_patterns:
+        # names matched exactly are recorded so that they are still matched exactly once glob patterns are on
+        names = [GLOB_WILDCARD_RE.sub(r'%\g<0>', name) for name in names]
+    entry = f"{command} ~{'|'.join([escape_arg(name) for name in names])}"
+    if augments:
+        entry += f" !{'|'.join(augments)}"
+    if contents is not None:
+        return ContentEntry(entry, list(contents))
+    return entry
+
+def read_files(name_list, range_list = [], context = None, recursive = False, follow = False):
     '''
     Print contents of File object(s) in current directory with names matching name_list indices to terminal.
+    Names may be glob patterns, and files below the current directory are also read if recursive,
+    including files in the folders that shortcuts lead to if follow.
+    range_list indices of the form start:end limit the content printed to that range of bytes.
     '''
-    global filesystem
-    match_list, absent_names = filesystem.get_name_matches(name_list)
+    if context is None:
+        context = global_context()
+    # get byte range associated with name, where one was passed
+    range_hash = {}
+    for i, byte_range in enumerate(range_list[:len(name_list)]):
+        if byte_range:
+            range_hash[name_list[i]] = byte_range
+
+    match_list, absent_names = match_objects(context.cwd, name_list, recursive, follow = follow)
     # iterate through objects stored in current context
-    for obj in match_list:
+    for obj, name in match_list:
         if obj.type == 'file':
+            header = f"File name: {obj.name}"
+            if recursive:
+                header += f" in {obj.context.get_address(True)}"
+            start, end = 0, None
+            if name in range_hash:
+                byte_range = parse_byte_range(range_hash[name])
+                if not byte_range:
+                    context.error(f"range {range_hash[name]} is not of the form start:end.")
+                    continue
+                start, end = byte_range
+                header += f" (bytes {range_hash[name]})"
             #print file content
-            print(f"File name: {obj.name}")
-            print("-" * 10)
-            print(obj.get_content())
-            print("-" * 10)
+            content = obj.get_content(start, end)
+            context.emit('file_content', f"{header}\n{'-' * 10}\n{content}\n{'-' * 10}", name = obj.name, content = content)
     if absent_names:
-        print(f"Err: files {', '.join(absent_names)} not found.")
+        context.error(f"files {', '.join(absent_names)} not found.")
     
 
-def write_files(name_list, augment = 'write', content_list = []):
+def parse_byte_range(byte_range):
+    '''
+    Converts a string of the form start:end into a tuple of byte offsets. Either offset may be left out.
+    Returns None if the string is not of that form.
+    '''
+    start, colon, end = byte_range.partition(':')
+    start, end = start.strip(), end.strip()
+    if not colon or not (start or '0').isdigit() or not (end or '0').isdigit():
+        return None
+    return int(start or 0), int(end) if end else None
+
+def write_files(name_list, augment = 'write', content_list = [], recursive = False):
     '''
     Write content_list indices to File object(s) in current directory with names matching name_list indices.
+    Names may be glob patterns, and files below the current directory are also written if recursive.
+    The command is recorded in history once, however many files it writes.
     '''
     global filesystem
     global command_history
@@ -605,40 +2493,59 @@ def write_files(name_list, augment = 'write', content_list = []):
     for i, name in enumerate(name_list):
         content_hash[name] = content_list[i]
 
-    match_list, absent_names = filesystem.get_name_matches(name_list)
-    for obj in match_list:
+    if augment != 'append':
+        augment = 'write'
+    match_list, absent_names = match_objects(filesystem, name_list, recursive)
+    written_names = {}
+    for obj, name in match_list:
         # get content at matching index
-        content = content_hash[obj.name]
+        content = content_hash[name]
         # iterate through objects in current context
         if obj.type == 'file':
+            prepare_mutation(obj)
+            start = obj.buffer.byte_size if augment == 'append' else 0
             # checks for augment. Function passes write as default.
-            if augment == 'write':
+            if augment == 'append':
+                if content_index is not None:
+                    # trigrams may start in the last two characters of the existing content
+                    index_content(obj, text_trigrams(obj.get_content(max(obj.buffer.byte_size - 8, 0))[-2:] + content))
+                obj.append_content(content)
+            else:
+                if content_index is not None:
+                    unindex_content(obj)
                 obj.content = content
-            elif augment == 'append':
-                obj.content += content
-                command_history.append(f"write ~{obj.name} !append #{content}")
-            command_history.append(f"write ~{obj.name} !write #{content}")
+                if content_index is not None:
+                    index_content(obj, text_trigrams(content))
+            if command_stats is not None:
+                command_stats.add('bytes_written', obj.buffer.byte_size - start)
+            # history reads the content back from the first file it was written to
+            written_names.setdefault(name, (obj.buffer, start, obj.buffer.byte_size))
+    if written_names:
+        command_history.append(bulk_record('write', written_names, augment, recursive, written_names.values()))
 
     if absent_names:
-        print(f"Err: files {', '.join(absent_names)} not found.")
+        print_error(f"files {', '.join(absent_names)} not found.")
         
                            
-def copy_objects(name_list):
+def copy_objects(name_list, recursive = False, context = None):
     '''
-    Copies objects in current directory with names in name_list to clipboard.
+    Copies objects in the working directory of context with names in name_list to its clipboard.
+    Names may be glob patterns, and objects below the working directory are also copied if recursive,
+    apart from objects within a folder that is itself copied.
     '''
-    global object_clipboard
-    object_clipboard = []
-    match_list, absent_names = filesystem.get_name_matches(name_list)
+    if context is None:
+        context = global_context()
+    context.clipboard = []
+    match_list, absent_names = match_objects(context.cwd, name_list, recursive, descend = False)
 
-    for obj in match_list:
-        # appends address to object_clipboard
-        object_clipboard.append(obj)
-        print(f"{obj.type} {obj.name} copied to clipboard.")
-        command_history.append(f"copy ~{obj.name}")
+    for obj, name in match_list:
+        context.clipboard.append(obj)
+        context.emit('copied', f"{obj.type} {obj.name} copied to clipboard.", type = obj.type, name = obj.name)
+    if match_list:
+        context.history.append(bulk_record('copy', dict.fromkeys([name for obj, name in match_list]), recursive = recursive))
 
     if absent_names:
-        print(f"Err: objects {', '.join(absent_names)} not found.")
+        context.error(f"objects {', '.join(absent_names)} not found.")
 
 
 def paste_objects():
@@ -649,119 +2556,482 @@ def paste_objects():
     global filesystem
     # proceed if clipboard is not empty
     if object_clipboard:
-        branches = [branch.name for branch in filesystem.get_branches()]
         for obj in object_clipboard:
             # if object name is already taken at destination, mutate name
-            name_buffer = obj.name
-            context_buffer = obj.context
-            while obj.name in branches:
-                obj.name += "_c"
-            # set object context to current filesystem
-            obj.context = filesystem
-            # clone object in clipboard and append clone to filesystem
-            filesystem.branches.append(copy.deepcopy(obj))
-            # restore name and context of original object
-            if name_buffer:
-                obj.name = name_buffer
-            obj.context = context_buffer
-            print(f"{obj.type} {obj.name} pasted to {filesystem.name}.")
-            command_history.append(f"paste")
+            name = filesystem.free_name(obj.name, "_c")
+            # clone shares objects and content with the object in clipboard until either is changed
+            clone = clone_subtree(obj, name, filesystem)
+            # clone is made first, so that pasting a folder within itself sees the folder before the paste
+            prepare_mutation(filesystem)
+            filesystem.add_branch(clone)
+            index_subtree(clone)
+            resolve_cache.clear()
+            emit('pasted', f"{obj.type} {obj.name} pasted to {filesystem.name}.", type = obj.type, name = obj.name, context = filesystem.name)
+        command_history.append(f"paste")
     else:
-        print("Err: clipboard is empty.")
+        print_error("clipboard is empty.")
 
-def list_context():
+def import_objects(name_list, path_list):
     '''
-    Prints information about objects in current working directory to terminal.
+    Creates a folder in current directory for each host directory in path_list, holding folders and files
+    built from the host directories and files within it, or a file for each host file in path_list.
+    Objects are named after the corresponding index of name_list, or after the host directory or file.
+    Host files are read on a pool of transfer_workers threads, as their content is decoded as UTF-8.
     '''
     global filesystem
-    branches = filesystem.get_branches()
+    global command_history
+
+    if not path_list:
+        print_error("no host path passed to import.")
+    for i, path in enumerate(path_list):
+        host_path = os.path.abspath(os.path.expanduser(path))
+        name = name_list[i] if i < len(name_list) and name_list[i] else os.path.basename(host_path)
+        name = filesystem.free_name(name.replace(':', '_') or 'import', '_o')
+        start = time.perf_counter()
+        if os.path.isdir(host_path):
+            obj = Folder(name, filesystem)
+            files, folder_count, failures = walk_host_directory(host_path, obj)
+            folder_count += 1
+        elif os.path.isfile(host_path):
+            obj = None
+            files, folder_count, failures = [(filesystem, name, host_path)], 0, []
+        else:
+            print_error(f"{path} is not a directory or file on the host.")
+            continue
+
+        # files are added in the order they were found, as their reads complete
+        size = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers = transfer_workers) as pool:
+            for (folder, file_name, file_path), result in zip(files, pool.map(read_host_file, [file[2] for file in files])):
+                if isinstance(result, OSError):
+                    failures.append(result)
+                    continue
+                data, char_size = result
+                file = File(file_name, folder, '')
+                file.buffer = ContentBuffer.from_bytes(data, char_size)
+                size += len(data)
+                if obj is None:
+                    obj = file
+                else:
+                    folder.add_branch(file)
+        elapsed = time.perf_counter() - start
+        for error in failures[:1]:
+            print_error(f"{len(failures)} host objects could not be read, such as {error.filename}: {error.strerror}.")
+        if obj is None:
+            continue
+
+        prepare_mutation(filesystem)
+        filesystem.add_branch(obj)
+        index_subtree(obj)
+        resolve_cache.clear()
+        emit_transfer('imported', f"{host_path} imported to {obj.name}", len(files) - len(failures), folder_count,
+                      size, elapsed, name = obj.name, path = host_path)
+        command_history.append(f"import ~{escape_arg(obj.name)} #{escape_arg(host_path)}")
+
+def walk_host_directory(host_path, folder):
+    '''
+    Builds a folder within folder for every directory below host_path, without following symbolic links,
+    in name order. Files are only added once they have been read, so within each folder they follow every
+    folder. Returns (folder, name, host path) of every file found, in name order within each folder,
+    the number of directories found, and the errors raised by directories that could not be read.
+    '''
+    files = []
+    failures = []
+    folder_count = 0
+    stack = [(host_path, folder)]
+    while stack:
+        host_path, folder = stack.pop()
+        try:
+            with os.scandir(host_path) as entries:
+                entries = sorted(entries, key = lambda entry: entry.name)
+        except OSError as error:
+            failures.append(error)
+            continue
+        for entry in entries:
+            # : separates the names of an address, so cannot be held by a name
+            name = entry.name.replace(':', '_')
+            if name in folder.branch_index:
+                name = folder.free_name(name, '_o')
+            if entry.is_dir(follow_symlinks = False):
+                subfolder = Folder(name, folder)
+                folder.add_branch(subfolder)
+                stack.append((entry.path, subfolder))
+                folder_count += 1
+            elif entry.is_file():
+                # placeholder keeps name taken until the file is added
+                folder.branch_index[name] = None
+                files.append((folder, name, entry.path))
+    for folder, name, path in files:
+        if folder.branch_index.get(name, folder) is None:
+            del folder.branch_index[name]
+    return files, folder_count, failures
+
+def read_host_file(path):
+    '''
+    Returns the content of the host file at path as UTF-8 bytes, with the number of characters they hold.
+    Bytes that are not valid UTF-8 are replaced. Returns the error raised if the file cannot be read.
+    '''
+    try:
+        with open(path, 'rb') as file:
+            data = file.read()
+    except OSError as error:
+        return error
+    text = str(data, 'utf-8', 'replace')
+    if '\ufffd' in text:
+        data = text.encode('utf-8')
+    return data, len(text)
+
+def export_objects(name_list, path_list, context = None):
+    '''
+    Writes objects in the working directory of context with names in name_list, or the working directory if
+    no name is passed, to the host paths at corresponding indices of path_list. A folder becomes a host directory
+    holding its objects, or a tar archive holding a directory of that name where the path ends in a TAR_MODES
+    extension. Shortcuts, and objects with names the host cannot hold, are skipped.
+    Files are written to host directories on a pool of transfer_workers threads.
+    '''
+    if context is None:
+        context = global_context()
+    cwd = context.cwd
+    if not path_list:
+        context.error("no host path passed to export.")
+    if name_list:
+        path_hash = dict(zip(name_list, path_list))
+        match_list, absent_names = cwd.get_name_matches(list(path_hash))
+        if absent_names:
+            context.error(f"objects {', '.join(absent_names)} not found.")
+    else:
+        path_hash = {cwd.name : path_list[0]} if path_list else {}
+        match_list = [cwd] if path_list else []
+
+    for obj in match_list:
+        path = path_hash[obj.name]
+        host_path = os.path.abspath(os.path.expanduser(path))
+        if obj.type == 'shortcut':
+            context.error(f"shortcut {obj.name} cannot be exported.")
+            continue
+        if os.path.exists(host_path) and not context.confirm(f"{host_path} already exists. Write {obj.name} over it?"):
+            context.emit('message', "Export command has been cancelled.")
+            continue
+        mode = next((mode for extension, mode in TAR_MODES.items() if host_path.endswith(extension)), None)
+        start = time.perf_counter()
+        try:
+            if mode:
+                file_count, folder_count, size, skipped = export_tar(obj, host_path, mode)
+            else:
+                file_count, folder_count, size, skipped = export_directory(obj, host_path)
+        except OSError as error:
+            context.error(f"{obj.name} could not be exported to {host_path}: {error.strerror or error}.")
+            continue
+        elapsed = time.perf_counter() - start
+        if skipped:
+            context.error(f"{skipped} shortcuts or objects with names the host cannot hold were not exported.")
+        if command_stats is not None:
+            command_stats.add('bytes_written', size)
+        emit_transfer('exported', f"{obj.name} exported to {host_path}", file_count, folder_count,
+                      size, elapsed, context, name = obj.name, path = host_path)
+
+def export_walk(obj):
+    '''
+    Yields (object, host path relative to obj) of obj and each folder and file within it, folders before
+    the objects they hold, and the number of objects skipped once the walk is done.
+    '''
+    skipped = 0
+    stack = [(obj, '')]
+    while stack:
+        obj, relative_path = stack.pop()
+        yield obj, relative_path
+        if obj.type != 'folder':
+            continue
+        for branch in reversed(obj.get_branches()):
+            if branch.type == 'shortcut' or branch.name in ('.', '..') or '/' in branch.name or '\0' in branch.name \
+                or (os.altsep and os.altsep in branch.name):
+                skipped += 1
+            else:
+                stack.append((branch, os.path.join(relative_path, branch.name)))
+    yield None, skipped
+
+def export_directory(obj, host_path):
+    '''
+    Writes obj to host_path, making directories as they are walked and writing files on a pool of threads.
+    Returns the number of files and folders written, bytes written and objects skipped.
+    '''
+    files = []
+    folder_count = 0
+    for obj, relative_path in export_walk(obj):
+        if obj is None:
+            skipped = relative_path
+        elif obj.type == 'folder':
+            os.makedirs(os.path.join(host_path, relative_path), exist_ok = True)
+            folder_count += 1
+        else:
+            files.append((obj.buffer, os.path.join(host_path, relative_path) if relative_path else host_path))
+    with concurrent.futures.ThreadPoolExecutor(max_workers = transfer_workers) as pool:
+        size = sum(pool.map(write_host_file, *zip(*files))) if files else 0
+    return len(files), folder_count, size, skipped
+
+def write_host_file(buffer, path) -> int:
+    # chunks in the blob store are written from memoryviews of it, without copying
+    chunks = buffer.get_chunks()[0]
+    with open(path, 'wb') as file:
+        for chunk in chunks:
+            file.write(buffer.get_chunk_data(chunk))
+    return buffer.byte_size
+
+def export_tar(obj, host_path, mode):
+    '''
+    Writes obj to a tar archive at host_path, compressed as given by mode, streaming each file's content
+    into the archive a chunk at a time. Returns the number of files and folders written, bytes written
+    and objects skipped.
+    '''
+    file_count = folder_count = size = 0
+    modified = time.time()
+    # gzip's own default level compresses almost as well as tarfile's level 9, several times faster
+    options = {'compresslevel' : 6} if mode == 'w:gz' else {}
+    with tarfile.open(host_path, mode, **options) as archive:
+        for branch, relative_path in export_walk(obj):
+            if branch is None:
+                skipped = relative_path
+                break
+            info = tarfile.TarInfo(os.path.join(obj.name, relative_path) if relative_path else obj.name)
+            info.mtime = modified
+            if branch.type == 'folder':
+                info.type = tarfile.DIRTYPE
+                info.mode = 0o755
+                archive.addfile(info)
+                folder_count += 1
+            else:
+                info.size = branch.buffer.byte_size
+                info.mode = 0o644
+                archive.addfile(info, ContentReader(branch.buffer))
+                file_count += 1
+                size += info.size
+    return file_count, folder_count, size, skipped
+
+def emit_transfer(event_type, text, file_count, folder_count, size, elapsed, context = None, **fields) -> None:
+    # rates are reported against at least a microsecond, as an empty transfer can take no measurable time
+    rate_time = max(elapsed, 1e-6)
+    (context or global_context()).emit(event_type, f"{text}: {file_count:,} files and {folder_count:,} folders, {size / 1e6:,.1f} MB "
+                     f"in {format_seconds(elapsed)} ({file_count / rate_time:,.0f} files/s, {size / 1e6 / rate_time:,.1f} MB/s).",
+         files = file_count, folders = folder_count, bytes = size, seconds = elapsed, **fields)
+
+def list_context(context = None):
+    '''
+    Prints information about objects in current working directory to terminal.
+    '''
+    if context is None:
+        context = global_context()
+    cwd = context.cwd
+    branches = cwd.get_branches()
     s_plural = 's' * (len(branches) != 1)
     colon = ':' * (len(branches) != 0) or '.'
-    print(f"{filesystem.type} {filesystem.name} contains {len(branches)} object{s_plural}{colon}")
-    for obj in branches:
-        print(f" > {obj.type} {obj.name}")
+    lines = [f"{cwd.type} {cwd.name} contains {len(branches)} object{s_plural}{colon}"]
+    lines.extend([f" > {obj.type} {obj.name}" for obj in branches])
+    context.emit('listing', '\n'.join(lines), type = cwd.type, name = cwd.name,
+                 branches = [[obj.type, obj.name] for obj in branches])
 
-def object_properties(name_list = []):
+def object_properties(name_list = [], context = None):
     '''
     Prints information about object(s) in current directory with names in name_list to terminal.
     If no names are passed, prints information about context object.
     '''
-    global filesystem
-    match_list, absent_names = filesystem.get_name_matches(name_list)
+    if context is None:
+        context = global_context()
+    match_list, absent_names = context.cwd.get_name_matches(name_list)
     # if no name argument passed, return properties of current filesystem object
     if not name_list:
-        object_properties_print(filesystem)
+        object_properties_print(context.cwd, context)
     else:
         for obj in match_list:
-            object_properties_print(obj)
+            object_properties_print(obj, context)
 
         if absent_names:
-            print(f"Err: objects {', '.join(absent_names)} not found.")
+            context.error(f"objects {', '.join(absent_names)} not found.")
 
 
-def object_properties_print(obj):
-    print(f"Properties:")
-    print("-" * 10)
-    print(f"Name: {obj.name}")
-    print(f"Type: {obj.type}")
-    print(f"Context: {obj.context}")
-    print(f"Address: {obj.get_address(True)}")
+def object_properties_print(obj, context):
+    properties = {
+        'name' : obj.name,
+        'type' : obj.type,
+        'context' : str(obj.context),
+        'address' : obj.get_address(True)
+    }
+    lines = ["Properties:", "-" * 10, f"Name: {obj.name}", f"Type: {obj.type}",
+             f"Context: {obj.context}", f"Address: {properties['address']}"]
     if obj.type == 'file':
-        print(f"Content size: {len(obj.content)} characters.")
+        properties['size'] = obj.get_size()
+        lines.append(f"Content size: {properties['size']} characters.")
     elif obj.type == 'folder':
-        print(f"Number of branches: {len(obj.get_branches())}")
+        properties['branches'] = len(obj.get_branches())
+        lines.append(f"Number of branches: {properties['branches']}")
     elif obj.type == 'shortcut':
-        print(f"Location reference: {obj.branches[0].get_address(True)}")
-    print("-" * 10)
+        properties['location'] = obj.location.get_address(True)
+        lines.append(f"Location reference: {properties['location']}")
+    lines.append("-" * 10)
+    context.emit('properties', '\n'.join(lines), **properties)
 
-def delete_objects(name_list = [], augment = ''):
+def delete_objects(name_list = [], augment = '', recursive = False):
     '''
     Deletes objects in current directory with names in name_list.
+    Names may be glob patterns, and objects below the current directory are also deleted if recursive.
     If no names are passed, deletes context object.
     '''
     global filesystem
-    match_list, absent_names = filesystem.get_name_matches(name_list)
+    global shortcut_generation
     if not name_list:
         # skip user validation if augment passed
         user_check = (augment == 'certain')
-        while not user_check:
-            user_command = input("Calling delete without specifying a name argument will delete the current context object. Do you want to continue? (Y/N) > ")
-            if user_command.upper() == "Y":
-                user_check = True
-            break
+        if not user_check:
+            user_check = confirm("Calling delete without specifying a name argument will delete the current context object. Do you want to continue?")
         # requires user consent and for filesystem to not be root folder
+        # recorded as the out and delete commands performed here
         if user_check and filesystem.context:
             loc_temp = [filesystem.name]
-            move_out()
+            call_globally(move_out)
             delete_objects(loc_temp)
-            command_history.append(f"delete !certain")
     else:
-        for obj in match_list:
+        # objects within a deleted folder go with it
+        match_list, absent_names = match_objects(filesystem, name_list, recursive, descend = False)
+        prepare_mutation(filesystem)
+        for obj, name in match_list:
+            context = obj.context
+            if context is not filesystem:
+                prepare_mutation(context)
             # pass object reference to remove method to delete from filesystem
-            filesystem.branches.remove(obj)
-            print(f"{obj.type} {obj.name} deleted from {filesystem.type} {filesystem.name}.")
-            command_history.append(f"delete ~{obj.name} !certain")
+            context.remove_branch(obj)
+            unindex_subtree(obj)
+            resolve_cache.clear()
+            shortcut_generation += 1
+            emit('deleted', f"{obj.type} {obj.name} deleted from {context.type} {context.name}.",
+                 type = obj.type, name = obj.name, context = context.name)
+        if match_list:
+            command_history.append(bulk_record('delete', dict.fromkeys([name for obj, name in match_list]), 'certain', recursive))
 
         if absent_names:
-            print(f"Err: objects {', '.join(absent_names)} not found.")
+            print_error(f"objects {', '.join(absent_names)} not found.")
 
     pass
 
-def search_filesystem_wrapper(name_list):
-    global filesystem
+def search_filesystem_wrapper(name_list, augment = '', context = None, follow = False):
+    if context is None:
+        context = global_context()
+    # the !parallel augment tests the names of name_index on search_pool rather than in this process,
+    # and the !follow augment walks it through shortcuts
+    if follow:
+        search_function = search_follow
+    elif augment == 'parallel':
+        search_function = search_parallel
+    else:
+        search_function = search_index
     # wrapper manages name plurality
     # calls search_filesystem function for each name in list
-    print("Search results:")
+    context.emit('output', "Search results:")
     for name in name_list:
-        search_results = search_filesystem(filesystem, name)
+        search_results = search_function(context.cwd, name)
         if search_results:
-            print("-" * 10)
+            context.emit('output', "-" * 10)
             for result in search_results:
-                print(f"Name: {result.name}")
-                print(f"Address: {result.get_address(True)}")
-                print("-" * 10)
+                address = result.get_address(True)
+                context.emit('search_result', f"Name: {result.name}\nAddress: {address}\n{'-' * 10}",
+                     query = name, name = result.name, address = address)
+        else:
+            context.error(f"no matches found for \"{name}\" within {context.cwd.name}.")
+
+def grep_files(text_list, context = None):
+    '''
+    Prints the address of each file below the current working directory whose content contains
+    a text in text_list, with the numbered lines holding the text.
+    '''
+    if context is None:
+        context = global_context()
+    context.emit('output', "Grep results:")
+    for text in text_list:
+        grep_results = grep_index(context.cwd, text)
+        if grep_results:
+            context.emit('output', "-" * 10)
+            for obj, content in grep_results:
+                address = obj.get_address(True)
+                lines = [[number, line] for number, line in enumerate(content.split('\n'), 1) if text in line]
+                line_text = ''.join([f"{number}: {line}\n" for number, line in lines])
+                context.emit('grep_result', f"Address: {address}\n{line_text}{'-' * 10}",
+                             query = text, address = address, lines = lines)
+        else:
+            context.error(f"no files containing \"{text}\" found within {context.cwd.name}.")
+
+def grep_index(search_obj, text) -> list:
+    '''
+    Uses content_index to locate files below search_obj whose content contains text.
+    Returns (file, content) tuples ordered by address.
+    '''
+    search_depth = search_obj.get_depth()
+    # greps running in parallel may add files of lazy clones to content_index,
+    # so the lock is held only while the candidates are copied out of it
+    with cache_lock:
+        materialize_pending(search_obj)
+        if content_index is None:
+            build_content_index()
+        trigrams = text_trigrams(text)
+        if trigrams:
+            # only files holding every trigram of text can contain text, so intersect from the rarest trigram
+            trigram_sets = sorted([content_index.get(trigram, set()) for trigram in trigrams], key = len)
+            candidates = set(trigram_sets[0])
+            for trigram_set in trigram_sets[1:]:
+                if not candidates:
+                    break
+                candidates &= trigram_set
         else:
-            print(f"Err: no matches found for \"{name}\" within {filesystem.name}.")
+            # text shorter than a trigram is looked for in every file
+            candidates = set(content_files)
+    if command_stats is not None:
+        command_stats.add('nodes_visited', len(candidates))
+    # only files within the context of search_obj are kept
+    candidates = [obj for obj in candidates if is_within(obj, search_obj, search_depth)]
+
+    # trigrams can match in a different order than text, so candidates are confirmed against their content
+    grep_results = []
+    for obj in candidates:
+        content = obj.content
+        if text in content:
+            grep_results.append((obj, content))
+    grep_results.sort(key = lambda result: result[0].get_address())
+    return grep_results
+
+def text_trigrams(text) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def file_trigrams(obj) -> set:
+    # content is read a chunk at a time, keeping the last two characters of each chunk for trigrams spanning chunks
+    trigrams = set()
+    tail = ''
+    for text in obj.buffer.iter_text():
+        text = tail + text
+        trigrams.update(text_trigrams(text))
+        tail = text[-2:]
+    return trigrams
+
+def index_content(obj, trigrams) -> None:
+    content_files.add(obj)
+    for trigram in trigrams:
+        content_index.setdefault(trigram, set()).add(obj)
+
+def unindex_content(obj) -> None:
+    content_files.discard(obj)
+    for trigram in file_trigrams(obj):
+        index_set = content_index[trigram]
+        index_set.discard(obj)
+        if not index_set:
+            del content_index[trigram]
+
+def build_content_index() -> None:
+    '''
+    Builds content_index from every file in name_index. Once built, content_index is kept up to date
+    by index_subtree, unindex_subtree and write_files, until rebuild_name_index discards it.
+    '''
+    global content_index
+    content_index = {}
+    for index_set in name_index.values():
+        for obj in index_set:
+            if obj.type == 'file':
+                index_content(obj, file_trigrams(obj))
 
 def search_filesystem(search_obj, name, recursive = False):
     '''
@@ -782,18 +3052,293 @@ def search_filesystem(search_obj, name, recursive = False):
             search_results.extend(results)
     return search_results
 
+def search_parallel(search_obj, name) -> list:
+    '''
+    Locates the same objects as search_index, in the same order, testing every name in name_index on
+    search_pool. Runs of names are tested by the processes, which return the names contained in name,
+    and these are mapped back through name_index to the objects within the context of search_obj.
+    Indexes of fewer than parallel_search_threshold names are tested in this process, as starting
+    processes and sending names would cost more than the test.
+    '''
+    search_depth = search_obj.get_depth()
+    with cache_lock:
+        materialize_pending(search_obj)
+        index_names = list(name_index)
+
+    if len(index_names) < parallel_search_threshold:
+        match_names = match_index_names(index_names, name)
+    else:
+        # several runs per process, so that a slow run does not hold up the rest
+        size = -(-len(index_names) // (search_workers * 4))
+        futures = [get_search_pool().submit(match_index_names, index_names[start:start + size], name)
+                   for start in range(0, len(index_names), size)]
+        match_names = [index_name for future in futures for index_name in future.result()]
+
+    # objects may have been renamed or deleted while the names were tested
+    with cache_lock:
+        candidates = [obj for match_name in match_names for obj in name_index.get(match_name, ())]
+    search_results = [obj for obj in candidates if is_within(obj, search_obj, search_depth)]
+    if command_stats is not None:
+        command_stats.add('nodes_visited', len(candidates))
+    search_results.sort(key = lambda obj: obj.get_address())
+    return search_results
+
+def search_follow(search_obj, name) -> list:
+    '''
+    Walks the tree below search_obj and the folders its shortcuts lead to, each folder at most once,
+    to locate objects with name name, or whose names are contained in name. Ordered by address.
+    '''
+    search_results = []
+    visited = 0
+    for obj in walk_objects(search_obj, follow = True):
+        visited += 1
+        if obj.name in name:
+            search_results.append(obj)
+    if command_stats is not None:
+        command_stats.add('nodes_visited', visited)
+    search_results.sort(key = lambda obj: obj.get_address())
+    return search_results
+
+def match_index_names(index_names, name) -> list:
+    '''
+    Returns the names in index_names that are equal to name or contained in it.
+    Runs in search_pool processes, so only takes and returns plain lists of strings.
+    '''
+    return [index_name for index_name in index_names if index_name in name]
+
+def get_search_pool():
+    '''
+    Returns search_pool, starting search_workers processes on first use.
+    '''
+    global search_pool
+    if search_pool is None:
+        # processes are spawned, as forking a process running engine threads can copy held locks
+        search_pool = concurrent.futures.ProcessPoolExecutor(max_workers = search_workers,
+                                                             mp_context = multiprocessing.get_context('spawn'))
+    return search_pool
+
+def search_index(search_obj, name) -> list:
+    '''
+    Uses name_index to locate objects below search_obj with name name, or whose names are contained in name.
+    Gives the same matches as search_filesystem, ordered by address.
+    '''
+    search_results = []
+    search_depth = search_obj.get_depth()
+    # searches running in parallel may add objects of lazy clones to name_index,
+    # so the lock is held only while the candidates are copied out of it
+    with cache_lock:
+        materialize_pending(search_obj)
+        # every matching name is a substring of name, so either look up each substring
+        # or test each indexed name, whichever is fewer operations
+        if len(name) * (len(name) + 1) // 2 < len(name_index):
+            match_names = {name[start:end] for start in range(len(name)) for end in range(start + 1, len(name) + 1)}
+        else:
+            match_names = [index_name for index_name in name_index if index_name in name]
+        candidates = [obj for match_name in match_names for obj in name_index.get(match_name, ())]
+
+    for obj in candidates:
+        # only keep objects within the context of search_obj
+        if is_within(obj, search_obj, search_depth):
+            search_results.append(obj)
+    if command_stats is not None:
+        command_stats.add('nodes_visited', len(candidates))
+
+    search_results.sort(key = lambda obj: obj.get_address())
+    return search_results
+
+def index_subtree(obj) -> None:
+    '''
+    Adds obj and all objects within its context to name_index.
+    '''
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        name_index.setdefault(obj.name, set()).add(obj)
+        if obj.type == 'file' and content_index is not None:
+            index_content(obj, file_trigrams(obj))
+        elif obj.type == 'folder':
+            if obj.clone_source is not None:
+                # objects of lazy clones are indexed once they are created
+                pending_clones.add(obj)
+            else:
+                stack.extend(obj.get_branches())
+
+def unindex_subtree(obj) -> None:
+    '''
+    Removes obj and all objects within its context from name_index.
+    '''
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        index_set = name_index[obj.name]
+        index_set.discard(obj)
+        if not index_set:
+            del name_index[obj.name]
+        if obj.type == 'file' and content_index is not None:
+            unindex_content(obj)
+        elif obj.type == 'folder':
+            if obj.clone_source is not None:
+                pending_clones.discard(obj)
+            else:
+                stack.extend(obj.get_branches())
+
+def reindex_name(obj, old_name) -> None:
+    # move renamed object to the index entry for its new name
+    index_set = name_index[old_name]
+    index_set.discard(obj)
+    if not index_set:
+        del name_index[old_name]
+    name_index.setdefault(obj.name, set()).add(obj)
+
+def rebuild_name_index(root) -> None:
+    global name_index
+    global pending_clones
+    global content_index
+    global content_files
+    name_index = {}
+    pending_clones = set()
+    # content_index is only rebuilt once content is next searched
+    content_index = None
+    content_files = set()
+    index_subtree(root)
+
+def materialize_pending(search_obj) -> None:
+    '''
+    Materializes every lazy clone within search_obj, so that every object within search_obj is in name_index.
+    Called with cache_lock held.
+    '''
+    search_depth = search_obj.get_depth()
+    for folder in list(pending_clones):
+        if folder in pending_clones and (folder is search_obj or is_within(folder, search_obj, search_depth)):
+            stack = [folder]
+            while stack:
+                obj = stack.pop()
+                if obj.type == 'folder':
+                    stack.extend(obj.get_branches())
+
+def clone_subtree(obj, name, context):
+    '''
+    Returns a lazy clone of obj with name name in context.
+    Shortcuts within obj that refer to objects within obj are made to refer to the matching objects
+    within the clone as the folders holding them are filled, so cloning costs the same whatever obj holds.
+    '''
+    clone = obj.clone(name, context)
+    if obj.type == 'folder':
+        clone.clone_roots = (clone.clone_roots or ()) + (CloneRoot(clone, obj),)
+    return clone
+
+def retarget_shortcuts(folder, roots) -> None:
+    '''
+    Makes each shortcut that folder was just filled with refer to the object matching its location
+    within each clone in roots whose source contains the location, innermost first.
+    '''
+    for obj in folder.branches:
+        if obj.type != 'shortcut':
+            continue
+        location = obj.location
+        # clones the location has been found through so far
+        found_through = []
+        for root in roots:
+            # deleted objects keep their context, so a location deleted since the clone was made is still matched
+            context = location
+            while context and context is not root.source:
+                context = context.context
+            if not context:
+                continue
+            location = find_clone(root, location, found_through)
+            if location is None:
+                break
+            obj.location = location
+            found_through.append(root)
+
+def find_clone(root, obj, found_through = ()):
+    '''
+    Returns the object within root.clone made from obj within root.source, materializing the path to it,
+    or None if obj was not within root.source when the clone was made.
+    A folder cloned from a lazy clone is filled straight from that clone's source, so obj is traced back
+    through the fills of the clones in found_through to the object that folder was filled from.
+    '''
+    path = []
+    while obj is not root.source:
+        path.append(obj)
+        obj = obj.context
+    clone = root.clone
+    for obj in reversed(path):
+        if clone.type != 'folder':
+            return None
+        clone.get_branches()
+        if clone not in root.fills:
+            return None
+        source, sources, clones = root.fills[clone]
+        for through in reversed(found_through):
+            if obj.context is source:
+                break
+            fill = through.fills.get(obj.context)
+            if fill is None or obj not in fill[2]:
+                return None
+            obj = fill[1][fill[2].index(obj)]
+        if obj.context is not source or obj not in sources:
+            return None
+        clone = clones[sources.index(obj)]
+    return clone
+
+def is_held_by(obj, container) -> bool:
+    '''
+    Returns True if obj is container, or can be reached from container through branches.
+    '''
+    # deleted objects keep their context, so each step is checked against the branches of its context
+    while obj is not container:
+        context = obj.context
+        if not context or context.type != 'folder' or context.branch_index.get(obj.name) is not obj:
+            return False
+        obj = context
+    return True
+
+def is_within(obj, container, container_depth) -> bool:
+    # container can only be found a fixed number of contexts above obj
+    steps = obj.get_depth() - container_depth
+    if steps < 1:
+        return False
+    curr_context = obj
+    for i in range(steps):
+        curr_context = curr_context.context
+    return curr_context is container
+
+def prepare_mutation(obj) -> None:
+    '''
+    Materializes every lazy clone of obj and of the objects containing obj, from the root down.
+    Called before obj or an object within it is changed, so that lazy clones keep the objects
+    they were cloned with. Each materialized clone passes the dependency on to its own objects,
+    so only the clones along the path to obj are copied.
+    '''
+    path = []
+    curr_context = obj
+    while curr_context:
+        path.append(curr_context)
+        curr_context = curr_context.context
+    for curr_context in reversed(path):
+        if curr_context.type == 'folder' and curr_context.clone_dependents:
+            dependents = curr_context.clone_dependents
+            curr_context.clone_dependents = None
+            for clone in dependents:
+                # clones accessed since being made are already materialized
+                if clone.clone_source is curr_context:
+                    clone.materialize()
+
 def help(name_list):
     if not name_list:
-        print("--HELP--")
-        print("Enter one of the following keywords to access a specific resource.")
-        print("After entering a .")
-        print("intro : introduction to the filesystem.")
-        print("about : description of the filesystem.")
-        print("cli : explanation of the command line interface.")
-        print("glossary : descriptions of command arguments and their functions.")
-        print("augments : descriptions of augment arguments and their effects.")
-        user_command = input("> ")
-        help_text(user_command)
+        emit('output', "--HELP--")
+        emit('output', "Enter one of the following keywords to access a specific resource.")
+        emit('output', "After entering a .")
+        emit('output', "intro : introduction to the filesystem.")
+        emit('output', "about : description of the filesystem.")
+        emit('output', "cli : explanation of the command line interface.")
+        emit('output', "glossary : descriptions of command arguments and their functions.")
+        emit('output', "augments : descriptions of augment arguments and their effects.")
+        # batch mode has no user to enter a keyword
+        if batch_answer is None:
+            user_command = input("> ")
+            help_text(user_command)
     else:
         for name in name_list:
             help_text(name)
@@ -809,22 +3354,45 @@ def help_text(name):
         "shortcut" : " shortcut (name|) (address|) - create new shortcut in context with specified destination address.",
         "exit" : "exit (augment) - \tbegin exit dialogue, exit immediately if !certain augment passed.",
         "load" : "load (name) - \t\tloads filesystem stored in file with specified name.",
-        "save" : "save (name) - \t\tsaves filesystem in new file with specified name.",  
-        "read" : "read (name|) (augment) - prints content of named file to terminal.",
+        "save" : "save (name) (augment) - saves filesystem in new file with specified name.",  
+        "compact" : "compact (augment) - \treduces command history to the commands needed to rebuild the filesystem.",
+        "clear" : "clear (augment) - \treplaces filesystem with an empty root folder.",
+        "snapshot" : "snapshot (name|) (augment) - stores a snapshot of the filesystem with each name. lists snapshots if no name is passed.",
+        "rollback" : "rollback (name) - \treplaces filesystem with the named snapshot.",
+        "journal" : "journal (augment) - \tprints the state of the journal opened with --journal.",
+        "stats" : "stats (augment) - \tprints the number of calls, latency and counters of each command since statistics were enabled.",
+        "read" : "read (name|) (content|) - prints content of named file to terminal, limited to a start:end range of bytes if passed as content.",
         "write" : "write (name|) (augment) (content|) - writes passed content to named file at named location.",
         "copy" : "copy (name|) - \t\tcopies named object(s) to variable. ",
+        "import" : "import (name|) (content|) - creates a folder or file in context from each host directory or file path passed as content.",
+        "export" : '''export (name|) (content|) - writes named object(s), or the current context, to each host path passed as content.
+                      paths ending in .tar, .tar.gz, .tgz, .tar.bz2 or .tar.xz are written as tar archives.''',
         "paste" : "paste (location) (augment) - pastes copied object(s) to named location. object names are preserved but appended with a copy tag.",
         "list" : '''list (name) (location) (augment) - prints list of objects in the context of the given location.
                     name argument is used to pass object types like 'files', 'folders', or 'all'.''',
         "props" : "props (name|) (augment) - prints properties of named object, such as location, size, and names of contained objects.",
         "delete" : "delete (name|) (location) (augment) - destroys named objects.",
+        "grep" : "grep (content|) - \tprints addresses and matching lines of files within the current context containing the content.",
         "search" : '''search (name) (location) (augment) - searches for named object within context of given location. Returns names and locations of any matches.
                       search uses current location if no location argument is passed.''',
     }
     aug_hash = {
-        "certain" : "!certain - skips any validation dialogue otherwise required by a command. Used by delete and exit.",
+        "certain" : "!certain - skips any validation dialogue otherwise required by a command. Used by delete, clear and exit.",
         "append" : "!append - appends content argument to end of existing data in file. Used by write.",
         "write" : "!write - replaces any existing data in file with content argument. Used by write",
+        "history" : "!history - saves the command history instead of a snapshot of the filesystem. Used by save.",
+        "lazy" : "!lazy - reads each folder of a saved filesystem the first time it is accessed. Used by load.",
+        "measure" : "!measure - prints the time taken to replay the command history before and after compaction. Used by compact.",
+        "delete" : "!delete - discards named snapshots. Used by snapshot.",
+        "recursive" : "!recursive - also acts on matching objects below the current context. Used by delete, read, copy, write and rename, alongside any other augment as in !append|recursive.",
+        "follow" : "!follow - also walks the folders that shortcuts lead to, each folder once. Used by search, and by read with !recursive.",
+        "parallel" : "!parallel - tests the names of the name index on a pool of processes. Used by search.",
+        "on" : "!on - enables recording of command statistics. Used by stats.",
+        "off" : "!off - disables recording of command statistics. Used by stats.",
+        "reset" : "!reset - discards the command statistics recorded so far. Used by stats.",
+        "json" : "!json - prints command statistics as JSON. Used by stats.",
+        "sync" : "!sync - writes journal records not yet synced to disk. Used by journal.",
+        "checkpoint" : "!checkpoint - writes the filesystem to a new checkpoint and begins a new journal. Used by journal.",
     }
     function_list = [func for func in func_hash.keys()]
     augment_list = [aug for aug in aug_hash.keys()]
@@ -835,7 +3403,7 @@ filesystem.py is a program that simulates the behaviours of a text-based compute
 The program allows you to navigate a hierarchy of object nodes, read the states of specific nodes and modify node states as you see fit.
 To give a command to the program, enter a command name followed by arguments separated with whitespaces and prefixed with appropriate tags.
 '''
-        print(text_intro)
+        emit('output', text_intro)
     elif name == 'about':
         text_about = '''
 The filesystem consists of a tree of objects, where each object contains references to the objects it contains and the object containing it.
@@ -843,7 +3411,7 @@ The current state of the filesystem is defined by a global variable, which is ac
 Each command that alters the filesystem is stored in a list. When a save command is entered, the program commits this data to an external file.
 When a load command is entered, such as during initialisation, the data is read from a file and executed as a sequence of commands, thereby rebuilding the filesystem.
 '''
-        print(text_about)
+        emit('output', text_about)
 
     elif name == 'cli':
         text_cli = '''
@@ -859,39 +3427,53 @@ General form of command line arguments:
     cmd: \tKeyword that identifies which function to perform. Cannot be plural.
     name: \tPrefixed with ~, used to either define a new name or identify an existing name.
     location: \tPrefixed with @, defines location within filesystem to move to or act upon. Consists of a string of object names separated by : symbols.
-    augment: \tPrefixed with !, optional argument that alters the behavior of some functions. Cannot be plural.
+    augment: \tPrefixed with !, optional argument that alters the behavior of some functions. Cannot be plural, apart from !recursive and !follow.
     content: \tPrefixed with #, defines data to be stored within a filesystem object.
 
+    The names passed to delete, read, copy, write and rename can be glob patterns, where * matches any text,
+    ? any one character and [abc] any of the characters listed. Each * in the new name passed to rename is
+    replaced by the text matched by the pattern's next wildcard, so rename ~*.txt #*.md renames every .txt file.
+    A wildcard preceded by % matches the character itself, so delete ~notes%? deletes only notes?, and %* in
+    the new name is a *. Files of commands read by load are replayed with patterns off, matching names exactly.
+
     Only the arguments required by the desired function need to be included in each command.
     The command argument must be the first argument, and the content argument must be the last argument.
     Some functions can accept arguments which are a tuple of sub-arguments, where each argument is separated by a |.
+    Tag characters, | and % can be used within an argument by preceding them with the escape character %,
+    as can spaces at either end of an argument. Line breaks are written as %n, and carriage returns as %r.
+    Any other % is read as text, so #100% done is written as it reads.
 '''
-        print(text_cli)
+        emit('output', text_cli)
 
     elif name == 'glossary':
-        print("Suffix of | indicates argument can be of plural form.")
+        emit('output', "Suffix of | indicates argument can be of plural form.")
         for f_name in function_list:
-            print(func_hash[f_name])
+            emit('output', func_hash[f_name])
 
     elif name in function_list:
-        print(func_hash[name])
+        emit('output', func_hash[name])
 
     elif name == 'augments':
         for a_name in augment_list:
-            print(aug_hash[a_name])
+            emit('output', aug_hash[a_name])
 
     elif name in augment_list:
-        print(aug_hash[name])
+        emit('output', aug_hash[name])
 
     else:
-        print("Err: keyword not recognised.")
+        print_error("keyword not recognised.")
 
-def rename_objects(name_list, content_list = []):
+def rename_objects(name_list, content_list = [], recursive = False):
     '''
     Finds objects with names in name_list, changes their names to corresponsing names in content_list.
+    Names may be glob patterns, where each * of the new name is replaced by the text matched by the
+    next wildcard of the pattern. Objects below the current directory are also renamed if recursive.
+    The command is recorded in history once, however many objects it renames.
     '''
     global filesystem
     global command_history
+    global address_generation
+    global shortcut_generation
     
     len_name = len(name_list)
     len_con = len(content_list)
@@ -905,51 +3487,219 @@ def rename_objects(name_list, content_list = []):
         name_hash[name] = content_list[i]
 
     # get list of objects to rename
-    match_list, absent_names = filesystem.get_name_matches(name_list)
-    branches = filesystem.get_branches()
-
-    for obj in match_list:
+    match_list, absent_names = match_objects(filesystem, name_list, recursive)
+    if match_list:
+        prepare_mutation(filesystem)
+
+    for obj, name in match_list:
+        context = obj.context
+        if context is not filesystem:
+            prepare_mutation(context)
         # use object's name to get value from name_hash
         old_name = obj.name
-        new_name = name_hash[old_name]
+        new_name = glob_substitute(name, old_name, name_hash[name])
         
         # mutate new_name if object in context already possesses name
-        branch_names = [b_obj.name for b_obj in branches]
-        while new_name in branch_names:
-            new_name += '_r'
+        new_name = context.free_name(new_name, '_r')
         
-        obj.name = new_name
-        print(f"{obj.type} {old_name} renamed to {obj.name}.")
-        command_history.append(f"rename ~{old_name} #{new_name}")
+        context.rename_branch(obj, new_name)
+        reindex_name(obj, old_name)
+        resolve_cache.clear()
+        # addresses of obj and all objects within it have changed
+        address_generation += 1
+        shortcut_generation += 1
+        emit('renamed', f"{obj.type} {old_name} renamed to {obj.name}.", type = obj.type, old_name = old_name, name = obj.name)
+    if match_list:
+        renamed_names = dict.fromkeys([name for obj, name in match_list])
+        command_history.append(bulk_record('rename', renamed_names, recursive = recursive,
+                                           contents = [name_hash[name] for name in renamed_names]))
 
 
 # -- GLOBAL VARIABLES AND OBJECTS
 # filesystem variable is initialised with root folder
 # functions as a global variable providing handle on current directory
+filesystem = None
+root_object = Folder('root', '')
+command_history = []
+object_clipboard = []
+# name -> set of objects with that name, for every object in the filesystem
+name_index = {}
+# lazy clones in the filesystem whose objects have not been created, so are not in name_index
+pending_clones = set()
+# trigram -> set of files whose content holds it, built on first use, and every file it covers
+content_index = None
+content_files = set()
+# snapshot name -> (lazy clone of the root, address of the working directory) when snapshot was taken
+snapshots = {}
+# whether names passed to bulk commands can be glob patterns, which is not so while files of commands are loaded
+glob_patterns = True
+# SnapshotReader of each save file that folders are still to be read from
+snapshot_readers = weakref.WeakSet()
+# searches with the !parallel augment are matched on search_pool once name_index holds parallel_search_threshold names
+search_workers = os.cpu_count() or 1
+search_pool = None
+parallel_search_threshold = 200000
+# held while readers running in parallel update lazily built state: lazy clones, the objects
+# they add to name_index, resolve_cache and joined file content
+cache_lock = threading.RLock()
+# (root, address) -> object, for recently resolved addresses
+resolve_cache = OrderedDict()
+RESOLVE_CACHE_SIZE = 4096
+# incremented whenever objects are renamed or relocated, invalidating cached addresses
+address_generation = 0
+# incremented whenever objects are renamed or deleted, invalidating cached shortcut targets
+shortcut_generation = 0
+# receives output events from all commands
+output_sink = TextSink()
+# file content larger than blob_threshold bytes is moved out of memory to blob_store
+blob_threshold = 1 << 20
+blob_directory = None
+blob_store = None
+# CommandStats recording the time taken by each command, or None while statistics are disabled
+command_stats = None
+# upper bounds in seconds of the buckets of command latency histograms, the last bucket holding longer commands
+STATS_BUCKETS = [1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1]
+# threads reading and writing host files for import and export
+transfer_workers = min(32, (os.cpu_count() or 1) + 4)
+# extension of a path passed to export -> tarfile mode its archive is written with
+TAR_MODES = {'.tar' : 'w', '.tar.gz' : 'w:gz', '.tgz' : 'w:gz', '.tar.bz2' : 'w:bz2', '.tar.xz' : 'w:xz'}
+# answer given to confirmations in batch mode, None when commands come from the user
+batch_answer = None
+# line number of the batch command being executed, and (line number, message) of its errors
+batch_line = 0
+batch_errors = []
+
+# commands outside parallel_function_hash that do not change the tree, which engine sessions run as readers
+READ_COMMANDS = {'help', 'stats', 'journal'}
+# longest command line accepted by the server, in bytes
+SERVER_LINE_LIMIT = 1 << 24
+
+# Journal recording changes to the filesystem, or None if no journal is open
+journal = None
+# files written by Journal, of the form checkpoint-000001.txt and journal-000001.log
+JOURNAL_CHECKPOINT_RE = re.compile(r'checkpoint-(\d{6})\.txt')
+JOURNAL_FILE_RE = re.compile(r'(checkpoint|journal)-(\d{6})\.(txt|log)(\.tmp)?')
+
+# first line of files written by save_filesystem, and of files written before records were given an offset table
+SNAPSHOT_HEADER = 'fs-snapshot 2'
+SNAPSHOT_HEADER_DEPTH_FIRST = 'fs-snapshot 1'
+# width of the lines of save file offset tables, in bytes
+SNAPSHOT_OFFSET_WIDTH = 17
+SNAPSHOT_ESCAPES = {'\\' : '\\', 't' : '\t', 'n' : '\n', 'r' : '\r'}
+SNAPSHOT_ESCAPE_RE = re.compile(r'\\(.)')
+
+# characters that make a name a glob pattern unless escaped by %, wildcards of glob patterns and their escapes,
+# escapes of wildcards, characters escaped to be matched exactly, and wildcards of names they rename to
+GLOB_CHARS_RE = re.compile(r'(?<!%)[*?[]')
+GLOB_TOKEN_RE = re.compile(r'%[*?[]|\*|\?|\[!?\]?[^\]]*\]')
+GLOB_ESCAPE_RE = re.compile(r'%([*?[])')
+GLOB_WILDCARD_RE = re.compile(r'[*?[]')
+GLOB_STAR_RE = re.compile(r'%?\*')
+
+# patterns used by tokenize_command
+COMMAND_RE = re.compile(r'[^\s~@!#]*')
+TOKEN_RE = re.compile(r'%.|[~@!#|]')
+# only the escapes written by escape_arg are read back, so any other % is kept as text
+ESCAPE_RE = re.compile(r'%([~@!#|%nr])|^(?:%\s)+|(?:%\s)+$')
+ARG_ESCAPE_RE = re.compile(r'[~@!#|%\n\r]')
+ARG_ESCAPES = {'\n' : '%n', '\r' : '%r'}
+EDGE_SPACE_RE = re.compile(r'^\s+|\s+$')
+ARG_UNESCAPES = {'n' : '\n', 'r' : '\r'}
+TAG_ARGS = {'~' : 'name', '@' : 'location', '!' : 'augment', '#' : 'content'}
+
 if __name__ == '__main__':
-    filesystem = None
-    root_object = Folder('root', '')
-    command_history = []
-    object_clipboard = []
-    load_filesystem()
+    arg_parser = argparse.ArgumentParser(description = "Sandboxed text-based file system.")
+    arg_parser.add_argument('--load', metavar = 'FILE', default = 'default_filesystem.txt',
+                            help = "file to load the filesystem from, or '' to start with an empty root folder")
+    arg_parser.add_argument('--lazy', action = 'store_true',
+                            help = "read folders of the save file passed to --load the first time they are accessed, rather than at startup")
+    arg_parser.add_argument('--batch', metavar = 'FILE',
+                            help = "execute commands from FILE, or from stdin if FILE is -, without prompting")
+    arg_parser.add_argument('--serve', metavar = 'ADDRESS',
+                            help = "serve the filesystem to many sessions on host:port or unix:path, without prompting")
+    arg_parser.add_argument('--threads', metavar = 'N', type = int, default = 4,
+                            help = "threads running commands in server mode")
+    arg_parser.add_argument('--yes', action = 'store_true',
+                            help = "answer Y to confirmations in batch or server mode, which are otherwise answered N")
+    arg_parser.add_argument('--output', choices = ['text', 'quiet', 'json'], default = 'text',
+                            help = "print command output as text, discard it, or print it as JSON lines")
+    arg_parser.add_argument('--blob-threshold', metavar = 'BYTES', type = int, default = blob_threshold,
+                            help = "file content above this size is kept on disk rather than in memory")
+    arg_parser.add_argument('--blob-dir', metavar = 'DIR',
+                            help = "directory for the on-disk file content store, the system temporary directory by default")
+    arg_parser.add_argument('--stats', metavar = 'FILE',
+                            help = "record command statistics from startup, and write them to FILE as JSON on exit")
+    arg_parser.add_argument('--journal', metavar = 'DIR',
+                            help = "record every change in a journal in DIR, recovering the filesystem from DIR if it holds one")
+    arg_parser.add_argument('--journal-group', metavar = 'N', type = int, default = 1,
+                            help = "journal records written to disk together with one fsync")
+    arg_parser.add_argument('--journal-interval', metavar = 'SECONDS', type = float, default = 0.0,
+                            help = "longest time a journal record waits for its group before it is fsynced, 0 to wait for the group")
+    arg_parser.add_argument('--journal-checkpoint', metavar = 'N', type = int, default = 10000,
+                            help = "journal records after which a checkpoint is written and the journal begun again")
+    cli_args = arg_parser.parse_args()
+
+    blob_threshold = cli_args.blob_threshold
+    blob_directory = cli_args.blob_dir
+    output_sinks = {'text' : TextSink, 'quiet' : SilentSink, 'json' : JsonLinesSink}
+    set_output_sink(output_sinks[cli_args.output]())
+    if cli_args.stats:
+        command_stats = CommandStats()
+
+    if cli_args.batch:
+        batch_answer = cli_args.yes
+    # a journal directory holding a checkpoint replaces the file to load
+    journal_found = cli_args.journal and os.path.isdir(cli_args.journal) and any(
+        map(JOURNAL_CHECKPOINT_RE.fullmatch, os.listdir(cli_args.journal)))
+    if cli_args.load and not journal_found:
+        load_filesystem(cli_args.load, 'lazy' if cli_args.lazy else '')
+    else:
+        filesystem = Folder(root_object.name, '')
+    if cli_args.journal:
+        open_journal(cli_args.journal, cli_args.journal_group, cli_args.journal_interval, cli_args.journal_checkpoint)
+
+    if cli_args.batch:
+        if cli_args.batch == '-':
+            batch_ok = run_batch(sys.stdin)
+        else:
+            with open(cli_args.batch, 'r', encoding = 'utf-8') as batch_file:
+                batch_ok = run_batch(batch_file)
+        if cli_args.stats:
+            write_stats(cli_args.stats)
+        if journal:
+            journal.close()
+        sys.exit(0 if batch_ok else 1)
+
+    if cli_args.serve:
+        run_server(cli_args.serve, cli_args.yes, cli_args.threads)
+        if cli_args.stats:
+            write_stats(cli_args.stats)
+        if journal:
+            journal.close()
+        sys.exit(0)
+
     print("Welcome to the file system. Please enter a valid command, enter 'help' for a description of valid commands, or 'exit' to leave the program.")
     while True:
         # generate input line using address of filesystem
         user_command_raw = input(f"{filesystem.get_address(True)}> ")
         
         if not user_command_raw:
-            print("Err: cannot pass an empty string as argument.")
+            print_error("cannot pass an empty string as argument.")
             continue
 
-        user_command = command_sanitizer(user_command_raw)
-        if not user_command:
-            print("Err: command syntax is invalid.")
+        args = tokenize_command(user_command_raw)
+        if not args:
+            print_error("command syntax is invalid.")
             continue
 
         # exit() outside command_parser to break out of main loop
-        if user_command[:4] == "exit" and exit():
+        if args['command'] == "exit" and exit():
+            if cli_args.stats:
+                write_stats(cli_args.stats)
+            if journal:
+                journal.close()
             break
 
-        command_parser(user_command)
+        dispatch_command(args)
 
         
@@ -0,0 +1,111 @@
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import filesystem
+
+NAMES = ['a', 'b c', 'x%~y', 'p%@q', 'r%!s', 't%#u', 'v%|w', 'm%%n', 'e%nf', '%  g', 'h%  ']
+CONTENTS = ['plain', 'two%nlines', 'tab\tand %| bar', '%  padded%  ', 'crlf%r%nend']
+PATTERNS = ['*', '?', 'b*', '*%~*', '[aeh]*']
+
+
+def reset_filesystem() -> None:
+    filesystem.filesystem = filesystem.Folder('root', '')
+    filesystem.command_history = []
+    filesystem.object_clipboard = []
+    filesystem.snapshots.clear()
+    filesystem.resolve_cache.clear()
+    filesystem.rebuild_name_index(filesystem.filesystem)
+
+def dump() -> list:
+    '''
+    Returns the address, type and payload of every object in the tree, in address order.
+    The payload of a shortcut is the address of its location.
+    '''
+    objects = []
+    for obj in filesystem.walk_objects(filesystem.get_root()):
+        if obj.type == 'file':
+            payload = obj.content
+        elif obj.type == 'shortcut':
+            payload = obj.location.get_address(True)
+        else:
+            payload = None
+        objects.append((obj.get_address(True), obj.type, payload))
+    return sorted(objects)
+
+def session_commands(seed, count, import_path = '', journaled = False) -> list:
+    '''
+    Returns count random commands, with names and content holding tag characters, escapes, spaces,
+    line breaks and edge whitespace. Sessions to be journaled leave out import, whose host file a journal
+    does not record, and clear, which replaces the root.
+    '''
+    rng = random.Random(seed)
+    commands = []
+    for i in range(count):
+        name = rng.choice(NAMES)
+        roll = rng.random()
+        if roll < 0.14:
+            commands.append(f"folder ~{name}")
+        elif roll < 0.26:
+            commands.append(f"file ~{name} #{rng.choice(CONTENTS)}{i}")
+        elif roll < 0.32:
+            commands.append(f"write ~{name} !append #{rng.choice(CONTENTS)}")
+        elif roll < 0.42:
+            commands.append(f"in @{name}")
+        elif roll < 0.5:
+            commands.append("out")
+        elif roll < 0.54:
+            commands.append(f"cd @root:{name}")
+        elif roll < 0.6:
+            commands.append(f"shortcut ~l{name} @root:{rng.choice(NAMES)}")
+        elif roll < 0.66:
+            pattern = rng.choice(PATTERNS + [name])
+            recursive = ' !recursive' if rng.random() < 0.5 else ''
+            commands.append(f"rename ~{pattern}{recursive} #{rng.choice(NAMES)}")
+        elif roll < 0.7:
+            commands.append(f"delete ~{name}")
+        elif roll < 0.76:
+            recursive = ' !recursive' if rng.random() < 0.3 else ''
+            commands.append(f"copy ~{rng.choice(PATTERNS + [name])}{recursive}")
+        elif roll < 0.84:
+            commands.append("paste")
+        elif roll < 0.88:
+            commands.append(f"snapshot ~s{name}")
+        elif roll < 0.92:
+            commands.append(f"rollback ~s{name}")
+        elif roll < 0.95 and not journaled:
+            commands.append(f"import ~i{name} #{import_path}")
+        elif roll < 0.96 and not journaled:
+            commands.append("clear !certain")
+        else:
+            commands.append("cd @root")
+    return commands
+
+@pytest.fixture
+def fs(tmp_path, monkeypatch):
+    '''
+    Returns the filesystem module with an empty root folder, output discarded and confirmations answered Y.
+    Files saved by commands are written to a temporary directory.
+    '''
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(filesystem, 'batch_answer', True)
+    sink = filesystem.set_output_sink(filesystem.SilentSink())
+    reset_filesystem()
+    yield filesystem
+    filesystem.set_output_sink(sink)
+    if filesystem.journal is not None:
+        filesystem.journal.close()
+        filesystem.journal = None
+    reset_filesystem()
+
+@pytest.fixture
+def import_path(tmp_path):
+    '''
+    Returns the path of a host file for sessions to import.
+    '''
+    path = tmp_path / 'imported.txt'
+    path.write_bytes(b'first line\r\nsecond | line\n  edge  \n')
+    return str(path)
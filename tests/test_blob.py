@@ -0,0 +1,39 @@
+import pytest
+
+
+@pytest.fixture
+def store(fs, monkeypatch, tmp_path):
+    monkeypatch.setattr(fs, 'blob_threshold', 1000)
+    monkeypatch.setattr(fs, 'blob_directory', str(tmp_path))
+    monkeypatch.setattr(fs, 'blob_store', None)
+    return fs.get_blob_store()
+
+def test_rewritten_content_keeps_the_store_bounded(fs, store):
+    fs.command_parser('file ~a')
+    fs.command_parser('file ~b')
+    for i in range(200):
+        fs.command_parser(f"write ~a #{str(i) * 3000}")
+        fs.command_parser(f"write ~b #{chr(97 + i % 26) * 5000}")
+    live_size = sum(segment.length for segment in store.segments)
+    assert live_size >= 3000 + 5000
+    assert store.size <= 2 * live_size + 5000
+    assert fs.resolve('root:a').content == '199' * 3000
+    assert fs.resolve('root:b').content == 'r' * 5000
+
+def test_compacted_segments_read_the_same(fs, store):
+    fs.command_parser(f"file ~a #{'x' * 4000}")
+    fs.command_parser(f"file ~b #{'y' * 4000}")
+    fs.command_parser('copy ~b')
+    fs.command_parser('folder ~c')
+    fs.command_parser('in @c')
+    fs.command_parser('paste')
+    fs.command_parser('out')
+    fs.command_parser('delete ~a !certain')
+    fs.command_parser('compact')
+    view = fs.resolve('root:b').get_view()
+    store.compact()
+    assert store.size == 4000
+    # views taken before the store was compacted still read the old file
+    assert bytes(view) == b'y' * 4000
+    assert fs.resolve('root:b').content == 'y' * 4000
+    assert fs.resolve('root:c:b').content == 'y' * 4000
@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+
+@pytest.fixture
+def engine(fs):
+    engine = fs.Engine(4, True)
+    yield engine
+    engine.pool.shutdown()
+
+def events(output):
+    return [json.loads(line) for line in output.splitlines()]
+
+def test_sessions_keep_their_own_state(fs, engine):
+    first = fs.Session(engine.root)
+    second = fs.Session(engine.root)
+    for command in ['folder ~a', 'folder ~b', 'in @a', 'file ~f #text']:
+        engine.run(first, command)
+    engine.run(second, 'cd @root:b')
+    engine.run(first, 'copy ~f')
+    assert events(engine.run(second, 'paste'))[0]['event'] == 'error'
+    assert first.cwd.get_address(True) == 'root:a'
+    assert second.cwd.get_address(True) == 'root:b'
+    assert [str(entry) for entry in first.history][-2:] == ['file ~f #text', 'copy ~f']
+    assert second.history == ['cd @root:b']
+    assert fs.command_history == []
+
+def test_reading_commands_do_not_wait_for_the_globals(fs, engine):
+    session = fs.Session(engine.root)
+    for command in ['folder ~a', 'in @a', 'file ~f #text', 'out']:
+        engine.run(session, command)
+    # commands that swap state into the module globals would wait for this lock
+    with engine.globals_lock:
+        for command in ['in @a', 'copy ~f', 'out', 'cd @root:a', 'save ~tree', 'export ~f #exported.txt']:
+            done = events(engine.submit(session, fs.tokenize_command(command)).result(timeout = 10))[-1]
+            assert done['errors'] == 0
+    assert session.cwd.get_address(True) == 'root:a'
+    assert [obj.name for obj in session.clipboard] == ['f']
+    with open('exported.txt', encoding = 'utf-8') as file:
+        assert file.read() == 'text'
+
+def test_save_writes_the_tree_of_the_session(fs, engine):
+    session = fs.Session(engine.root)
+    for command in ['folder ~a', 'in @a', 'file ~f #text', 'save ~tree !history']:
+        engine.run(session, command)
+    script = fs.get_rebuild_script(engine.root, session.cwd)
+    assert [str(entry) for entry in session.history] == [str(entry) for entry in script]
+    assert fs.command_history == []
+    fs.load_filesystem('tree.txt')
+    assert fs.resolve('root:a:f').content == 'text'
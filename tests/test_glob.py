@@ -0,0 +1,50 @@
+from conftest import reset_filesystem
+
+
+def names(fs):
+    return sorted(obj.name for obj in fs.filesystem.get_branches())
+
+def make_files(fs, *file_names):
+    for name in file_names:
+        fs.command_parser(f"file ~{fs.escape_arg(name)}")
+
+def test_pattern_matches_every_name(fs):
+    make_files(fs, 'a[1]', 'a1', 'notes?', 'notes1', 'other')
+    fs.command_parser('delete ~a[1]|notes? !certain')
+    assert names(fs) == ['a[1]', 'other']
+
+def test_escaped_wildcards_match_themselves(fs):
+    make_files(fs, 'a[1]', 'a1', 'notes?', 'notes1', 'x*', 'xy')
+    fs.command_parser('delete ~a%[1]|notes%?|x%* !certain')
+    assert names(fs) == ['a1', 'notes1', 'xy']
+
+def test_escaped_wildcards_in_patterns(fs):
+    make_files(fs, 'a*.txt', 'ab.txt', 'a*.md')
+    fs.command_parser('rename ~a%*.* #b%*.*')
+    assert names(fs) == ['ab.txt', 'b*.md', 'b*.txt']
+
+def test_escaped_wildcards_replay_from_history(fs):
+    make_files(fs, 'a[1]', 'a1', 'notes?', 'notes1')
+    fs.command_parser('delete ~a%[1] !certain')
+    fs.command_parser('rename ~notes%? #n*')
+    history = [str(entry) for entry in fs.command_history]
+    expected = names(fs)
+    reset_filesystem()
+    for entry in history:
+        fs.command_parser(entry)
+    assert names(fs) == expected == ['a1', 'n*', 'notes1']
+
+def test_loaded_commands_match_names_exactly(fs, tmp_path):
+    # files of commands saved before glob patterns existed name objects holding wildcards
+    lines = ['file ~a[1]', 'file ~a1', 'file ~notes?', 'file ~notes1', 'delete ~a[1]|notes? !certain', 'end']
+    (tmp_path / 'legacy.txt').write_text('\n'.join(lines) + '\n', encoding = 'utf-8')
+    fs.load_filesystem('legacy.txt')
+    assert names(fs) == ['a1', 'notes1']
+    assert fs.glob_patterns
+
+    # the history of the load still matches exactly once patterns are on
+    history = [str(entry) for entry in fs.command_history]
+    reset_filesystem()
+    for entry in history:
+        fs.command_parser(entry)
+    assert names(fs) == ['a1', 'notes1']
@@ -0,0 +1,52 @@
+import pytest
+
+from conftest import dump, reset_filesystem, session_commands
+
+
+def run_session(fs, seed, import_path):
+    for command in session_commands(seed, 150, import_path):
+        fs.command_parser(command)
+
+def rebuilt_dump(fs):
+    '''
+    Returns dump, with shortcuts left at a missing location or a file by a delete or rename given the address
+    of their own context, as the rebuild script makes them.
+    '''
+    root = fs.get_root()
+    objects = []
+    for address, type, payload in dump():
+        if type == 'shortcut':
+            location = fs.resolve(payload, root)
+            if location is None or location.type == 'file':
+                payload = address.rpartition(':')[0]
+        objects.append((address, type, payload))
+    return objects
+
+@pytest.mark.parametrize('seed', range(20))
+def test_history_replays_to_the_same_tree(fs, import_path, seed):
+    run_session(fs, seed, import_path)
+    expected = dump()
+    history = [str(entry) for entry in fs.command_history]
+    reset_filesystem()
+    for entry in history:
+        fs.command_parser(entry)
+    assert dump() == expected
+
+@pytest.mark.parametrize('seed', range(20))
+def test_history_file_loads_to_the_same_tree(fs, import_path, seed):
+    run_session(fs, seed, import_path)
+    expected = rebuilt_dump(fs)
+    fs.command_parser('save ~history !history')
+    reset_filesystem()
+    fs.load_filesystem('history.txt')
+    assert rebuilt_dump(fs) == expected
+
+@pytest.mark.parametrize('seed', range(20))
+def test_rebuild_script_makes_the_same_tree(fs, import_path, seed):
+    run_session(fs, seed, import_path)
+    expected = rebuilt_dump(fs)
+    script = [str(entry) for entry in fs.get_rebuild_script(fs.get_root(), fs.filesystem)]
+    reset_filesystem()
+    for entry in script:
+        fs.command_parser(entry)
+    assert rebuilt_dump(fs) == expected
@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import dump, reset_filesystem, session_commands
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'filesystem.py')
+
+
+def run_script(directory, commands, extra):
+    batch = ''.join(command + '\n' for command in commands)
+    return subprocess.run([sys.executable, SCRIPT, '--load', '', '--batch', '-', '--yes', '--output', 'quiet'] + extra,
+                          input = batch, text = True, capture_output = True, cwd = directory)
+
+def make_dangling_shortcut(fs):
+    fs.command_parser('folder ~t')
+    fs.command_parser('shortcut ~s @root:t')
+    fs.command_parser('delete ~t')
+
+def assert_shortcut_finds_new_folder(fs):
+    fs.command_parser('folder ~t')
+    shortcut = fs.resolve('root:s')
+    assert shortcut.location.get_address(True) == 'root:t'
+    assert fs.shortcut_target(shortcut) is fs.resolve('root:t')
+
+def test_checkpoint_keeps_address_of_missing_target(fs, tmp_path):
+    fs.open_journal(str(tmp_path / 'journal'))
+    make_dangling_shortcut(fs)
+    fs.command_parser('journal !checkpoint')
+    fs.journal.close()
+    fs.journal = None
+
+    reset_filesystem()
+    fs.open_journal(str(tmp_path / 'journal'))
+    assert_shortcut_finds_new_folder(fs)
+
+def test_save_keeps_address_of_missing_target(fs):
+    make_dangling_shortcut(fs)
+    fs.command_parser('save ~tree')
+    reset_filesystem()
+    fs.load_filesystem('tree.txt')
+    assert_shortcut_finds_new_folder(fs)
+
+@pytest.mark.parametrize('seed', range(20))
+def test_recovered_tree_matches_uninterrupted_run(fs, tmp_path, seed):
+    commands = session_commands(seed, 300, journaled = True)
+    journal_directory = str(tmp_path / 'journal')
+    checkpoint_every = [5, 50, 10000][seed % 3]
+    run_script(tmp_path, commands, ['--journal', journal_directory, '--journal-checkpoint', str(checkpoint_every)])
+
+    # a record cut short by a crash is left at the end of the journal
+    path = next(os.path.join(journal_directory, name) for name in os.listdir(journal_directory) if name.endswith('.log'))
+    size = os.path.getsize(path)
+    with open(path, 'ab') as file:
+        file.write(b'0badf00d ["root", ["folder ~torn')
+    run_script(tmp_path, ['cd @root', 'save ~recovered'], ['--journal', journal_directory])
+
+    for command in commands:
+        fs.command_parser(command)
+    expected = dump()
+    fs.load_filesystem('recovered.txt')
+    assert dump() == expected
+    assert os.path.getsize(path) == size
@@ -0,0 +1,40 @@
+import pytest
+
+from conftest import dump, reset_filesystem
+
+
+def make_tree(fs):
+    # the records of the objects in a are written well before the table of offsets read with them,
+    # which follows the content of big
+    for command in ['folder ~a', 'in @a', 'folder ~b', 'in @b', 'file ~f #deep content', 'out', 'out',
+                    'shortcut ~l @root:a:b', 'folder ~c', 'in @c', f"file ~big #{'x' * 50000}", 'out']:
+        fs.command_parser(command)
+
+@pytest.mark.parametrize('name, filename', [('tree', 'tree.txt'), ('q', 'qsave.txt')])
+def test_save_over_lazily_loaded_file(fs, name, filename):
+    make_tree(fs)
+    fs.command_parser(f"save ~{name}")
+    expected = dump()
+    reset_filesystem()
+    fs.command_parser(f"load ~{filename} !lazy")
+    # the folders of a are only kept by the snapshot, so are still to be read from the file being replaced
+    fs.command_parser('snapshot ~before')
+    fs.command_parser('delete ~a')
+    fs.command_parser(f"save ~{name}")
+    fs.command_parser('rollback ~before')
+    assert dump() == expected
+
+    reset_filesystem()
+    fs.load_filesystem(filename)
+    assert sorted(obj.name for obj in fs.filesystem.get_branches()) == ['c', 'l']
+
+def test_save_history_over_lazily_loaded_file(fs):
+    make_tree(fs)
+    fs.command_parser('save ~tree')
+    expected = dump()
+    reset_filesystem()
+    fs.command_parser('load ~tree.txt !lazy')
+    fs.command_parser('save ~tree !history')
+    reset_filesystem()
+    fs.load_filesystem('tree.txt')
+    assert dump() == expected
@@ -0,0 +1,24 @@
+import pytest
+
+from conftest import session_commands
+
+
+@pytest.fixture
+def pool(fs, monkeypatch):
+    monkeypatch.setattr(fs, 'search_workers', 2)
+    monkeypatch.setattr(fs, 'parallel_search_threshold', 0)
+    yield
+    if fs.search_pool is not None:
+        fs.search_pool.shutdown()
+        fs.search_pool = None
+
+def addresses(objects):
+    return [obj.get_address(True) for obj in objects]
+
+@pytest.mark.parametrize('seed', range(3))
+def test_parallel_search_matches_index_search(fs, import_path, pool, seed):
+    for command in session_commands(seed, 300, import_path):
+        fs.command_parser(command)
+    for search_obj in [fs.get_root(), fs.filesystem]:
+        for name in ['a', 'b c', 'x~y', 'lh ', 'missing']:
+            assert addresses(fs.search_parallel(search_obj, name)) == addresses(fs.search_index(search_obj, name))
@@ -0,0 +1,41 @@
+import pytest
+
+from conftest import reset_filesystem
+
+TEXTS = ['plain', 'a b', 'x~y', 'p@q', 'r!s', 't#u', 'v|w', 'm%n', 'e\nf', 'crlf\r\nend', '  lead', 'trail  ',
+         '%', 'a%', '% b', '100% done', '50%? off', 'a%%b', 'tab\tin', '%n', 'x%~y']
+
+
+@pytest.mark.parametrize('text', TEXTS)
+def test_escaped_argument_reads_back(fs, text):
+    args = fs.tokenize_command(f"file ~{fs.escape_arg(text)} #{fs.escape_arg(text)}")
+    assert args['name'] == [text]
+    assert args['content'] == [text]
+
+@pytest.mark.parametrize('command, content', [
+    ('file ~a #100% done', '100% done'),
+    ('file ~a #50%? off', '50%? off'),
+    ('file ~a #%d and %s', '%d and %s'),
+    ('file ~a #100%% done', '100% done'),
+    ('file ~a #a%|b', 'a|b'),
+    ('file ~a #two%nlines', 'two\nlines'),
+    ('file ~a #% padded% ', ' padded '),
+    ('file ~a #mid% space', 'mid% space'),
+])
+def test_percent_is_only_read_as_an_escape_before_escaped_characters(fs, command, content):
+    assert fs.tokenize_command(command)['content'] == [content]
+
+def test_history_of_percent_content_replays(fs):
+    for command in ['folder ~50% off', 'in @50% off', 'file ~5%x #100% done', 'write ~5%x !append #% and 5%n', 'out']:
+        fs.command_parser(command)
+    history = [str(entry) for entry in fs.command_history]
+    reset_filesystem()
+    for entry in history:
+        fs.command_parser(entry)
+    assert fs.resolve('root:50% off:5%x').content == '100% done and 5\n'
+
+def test_legacy_history_file_keeps_percent(fs, tmp_path):
+    # files of commands written before escapes existed hold % as text
+    (tmp_path / 'legacy.txt').write_text('folder ~a\nin @a\nfile ~b #100% done\nend\n', encoding = 'utf-8')
+    fs.load_filesystem('legacy.txt')
+    assert fs.resolve('root:a:b').content == '100% done'
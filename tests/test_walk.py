@@ -0,0 +1,42 @@
+import pytest
+
+from conftest import session_commands
+
+
+def reachable_objects(fs, start):
+    '''
+    Returns every object within a folder reached from start through branches, or through chains of shortcuts.
+    '''
+    reachable = set()
+    visited = {start}
+    queue = [start]
+    while queue:
+        folder = queue.pop()
+        for obj in folder.get_branches():
+            reachable.add(obj)
+            target = obj
+            hops = set()
+            while target is not None and target.type == 'shortcut' and target not in hops:
+                hops.add(target)
+                target = fs.shortcut_target(target)
+            if target is not None and target.type == 'folder' and target not in visited:
+                visited.add(target)
+                queue.append(target)
+    return reachable
+
+@pytest.mark.parametrize('seed', range(20))
+def test_followed_walk_visits_every_reachable_object_once(fs, import_path, seed):
+    for command in session_commands(seed, 200, import_path):
+        fs.command_parser(command)
+    start = fs.get_root()
+    walked = list(fs.walk_objects(start, True))
+    assert len(walked) == len(set(walked))
+    assert set(walked) == reachable_objects(fs, start)
+
+def test_followed_walk_ends_at_shortcut_loops(fs):
+    fs.command_parser('folder ~a')
+    fs.command_parser('in @a')
+    fs.command_parser('shortcut ~up @root')
+    fs.command_parser('file ~f #x')
+    walked = list(fs.walk_objects(fs.get_root(), True))
+    assert sorted(obj.get_address(True) for obj in walked) == ['root:a', 'root:a:f', 'root:a:up']